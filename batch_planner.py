@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Token-budget-aware batching of summarization prompts.
+
+Sections are packed greedily, in order, into as few prompts as fit the model's
+context window: the fixed instructions, every section line, and a reserved
+output budget per section must all stay under the usable context. A batch
+whose response cannot be parsed is split and retried, so long inputs cost
+extra calls instead of lost sections.
+"""
+
+import os
+
+# Context window the prompts are planned for; also sent to Ollama as num_ctx
+MODEL_CONTEXT_TOKENS = int(os.environ.get("OLLAMA_NUM_CTX", "4096"))
+# Output tokens reserved for each section's summary in the response
+SUMMARY_TOKENS_PER_SECTION = int(os.environ.get("SUMMARY_TOKENS_PER_SECTION", "96"))
+# Fraction of the context used for planning, as headroom for the token estimate
+CONTEXT_SAFETY = 0.85
+
+
+def plan_batches(items, fixed_tokens, item_tokens, context_tokens=MODEL_CONTEXT_TOKENS,
+                 output_tokens_per_item=SUMMARY_TOKENS_PER_SECTION):
+    """
+    Pack items into consecutive batches so that, for each batch,
+        fixed_tokens + sum(item_tokens) + output_tokens_per_item * len(batch)
+    stays within the usable context. An item too large on its own gets a batch of its own.
+    item_tokens is a list parallel to items.
+    """
+    budget = int(context_tokens * CONTEXT_SAFETY) - fixed_tokens
+    batches = []
+    current = []
+    used = 0
+    for item, tokens in zip(items, item_tokens):
+        cost = tokens + output_tokens_per_item
+        if current and used + cost > budget:
+            batches.append(current)
+            current = []
+            used = 0
+        current.append(item)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def split_batch(batch):
+    """Halve a batch for a retry."""
+    mid = (len(batch) + 1) // 2
+    return [batch[:mid], batch[mid:]]
+
+
+def generation_options(batch_size, context_tokens=MODEL_CONTEXT_TOKENS,
+                       output_tokens_per_item=SUMMARY_TOKENS_PER_SECTION):
+    """Ollama options matching the plan: the planned context and a cap on the output length."""
+    return {"num_ctx": context_tokens, "num_predict": output_tokens_per_item * batch_size + 32}
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark: single-pass ParsedDocument vs. the old double-open extraction.
+
+For every collection, each mode runs in a fresh interpreter so that the peak RSS
+reported by the OS belongs to that mode alone.
+
+Usage:
+    python benchmarks/bench_parse.py ["Collection 1" ...]
+"""
+
+import json
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+MODES = ("double_open", "single_pass")
+
+
+def run_mode(mode, pdf_dir):
+    import fitz
+    from process_pdfs import ParsedDocument
+
+    pdfs = sorted(Path(pdf_dir).glob("*.pdf"))
+    # Both modes must produce the same headings and text; main() checks the totals agree
+    headings = chars = 0
+    start = time.perf_counter()
+    for pdf_path in pdfs:
+        if mode == "double_open":
+            # What process_and_summarize used to do: parse for the outline, then reopen for text
+            tree = ParsedDocument(pdf_path).outline_tree
+            with fitz.open(pdf_path) as doc:
+                text = "\n".join(page.get_text() for page in doc)
+        else:
+            doc = ParsedDocument(pdf_path)
+            tree = doc.outline_tree
+            text = doc.text
+        headings += len(tree)
+        chars += len(text)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"pdfs": len(pdfs), "headings": headings, "chars": chars, "seconds": round(elapsed, 3),
+            "peak_rss_mb": round(peak_rss_mb, 1)}
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--worker":
+        print(json.dumps(run_mode(sys.argv[2], sys.argv[3])))
+        return
+
+    collections = sys.argv[1:] or sorted(p.name for p in ROOT.glob("Collection *") if p.is_dir())
+    print(f"{'collection':<14} {'pdfs':>4} {'headings':>8} {'chars':>9} {'double_open s':>14} {'single_pass s':>14} "
+          f"{'saved':>7} {'double RSS MB':>14} {'single RSS MB':>14}")
+    for name in collections:
+        pdf_dir = ROOT / name / "PDFs"
+        results = {}
+        for mode in MODES:
+            out = subprocess.run(
+                [sys.executable, __file__, "--worker", mode, str(pdf_dir)],
+                capture_output=True, text=True, check=True
+            )
+            results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+        before, after = results["double_open"], results["single_pass"]
+        if (before["headings"], before["chars"]) != (after["headings"], after["chars"]):
+            sys.exit(f"{name}: modes disagree: double_open {before['headings']} headings, {before['chars']} chars; "
+                     f"single_pass {after['headings']} headings, {after['chars']} chars")
+        saved = 1 - after["seconds"] / before["seconds"] if before["seconds"] else 0.0
+        print(f"{name:<14} {after['pdfs']:>4} {after['headings']:>8} {after['chars']:>9} {before['seconds']:>14.3f} {after['seconds']:>14.3f} "
+              f"{saved:>7.0%} {before['peak_rss_mb']:>14.1f} {after['peak_rss_mb']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
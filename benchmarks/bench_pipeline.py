@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark: outline extraction and collection analysis against a mock Ollama.
+
+Corpora are synthetic PDFs (page count and headings per page configurable) and
+the bundled "Collection *" directories. Each corpus runs in a fresh interpreter
+so its peak RSS is its own. Per corpus this reports:
+
+    extract   ParsedDocument and its outline tree for every PDF: pages/s, sections/s and
+              p50/p95 per-document latency
+    pipeline  analyze_collection_with_ollama with the parse and LLM caches off,
+              against benchmarks/mock_ollama.py: calls/s and p50/p95 call latency
+    memory    peak RSS of the worker process
+
+Results can be saved as a baseline and later runs compared against it; any
+metric more than --tolerance worse than the baseline is flagged and the exit
+status is 1.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--docs 5] [--pages 20] [--headings-per-page 3] [--latency 0.2]
+    python benchmarks/bench_pipeline.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json [--tolerance 0.15]
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+WORDS = (
+    "travel itinerary budget museum coastline village festival cuisine wine market hotel beach hiking "
+    "castle history culture train schedule ticket restaurant guide tour weather season packing form "
+    "signature document workflow recipe vegetarian dinner buffet ingredient menu report analysis"
+).split()
+
+# (metric, True when higher is better) compared against the baseline
+COMPARED = (
+    ("extract.pages_per_s", True), ("extract.sections_per_s", True), ("extract.doc_p95_ms", False),
+    ("pipeline.seconds", False), ("pipeline.calls_per_s", True), ("pipeline.call_p95_ms", False),
+    ("peak_rss_mb", False),
+)
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) by linear interpolation; 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def sentence(rng, n=12):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def make_synthetic_pdf(path, pages, headings_per_page, seed=0):
+    """A PDF with a title, then per page headings_per_page H2/H3 headings each followed by body text."""
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_no in range(pages):
+        page = doc.new_page()
+        y = 72
+        if page_no == 0:
+            page.insert_text((72, y), f"Guide {seed}: {sentence(rng, 4)}", fontsize=24, fontname="hebo")
+            y += 40
+        for h in range(headings_per_page):
+            size = 16 if h % 2 == 0 else 13
+            page.insert_text((72, y), sentence(rng, 4).rstrip("."), fontsize=size, fontname="hebo")
+            y += size + 8
+            for _ in range(3):
+                page.insert_text((72, y), sentence(rng), fontsize=11, fontname="helv")
+                y += 15
+            y += 10
+            if y > 760:
+                break
+    doc.save(path)
+    doc.close()
+
+
+def make_synthetic_collection(directory, docs, pages, headings_per_page):
+    """A collection directory with PDFs/ and a challenge1b_input.json; returns the input path."""
+    directory = Path(directory)
+    (directory / "PDFs").mkdir(parents=True, exist_ok=True)
+    names = []
+    for i in range(docs):
+        name = f"synthetic_{i:03d}.pdf"
+        make_synthetic_pdf(directory / "PDFs" / name, pages, headings_per_page, seed=i)
+        names.append(name)
+    input_json = directory / "challenge1b_input.json"
+    input_json.write_text(json.dumps({
+        "documents": [{"filename": name, "title": name[:-4]} for name in names],
+        "persona": {"role": "Travel Planner"},
+        "job_to_be_done": {"task": "Plan a budget itinerary with museum visits, cuisine and beach days."},
+    }, indent=2))
+    return input_json
+
+
+def run_corpus(input_json, latency, workers):
+    """Benchmark one collection in this process; returns its metrics."""
+    from mock_ollama import MockOllamaServer
+
+    server = MockOllamaServer(latency=latency).start()
+    os.environ["OLLAMA_URL"] = os.environ["OLLAMA_URLS"] = server.url
+    os.environ["LLM_CACHE_BYPASS"] = "1"
+    os.environ.setdefault("LLM_BACKEND", "ollama")
+    # Keep synthetic corpora out of the persistent collection index
+    os.environ["COLLECTION_INDEX_PATH"] = str(Path(tempfile.mkdtemp()) / "collection_index.sqlite")
+    from process_pdfs import ParsedDocument, flatten_outline
+    import ollama_integration
+
+    input_json = Path(input_json)
+    with open(input_json, encoding="utf-8") as f:
+        documents = [d["filename"] for d in json.load(f)["documents"]]
+    pdfs = [input_json.parent / "PDFs" / name for name in documents]
+
+    doc_seconds = []
+    pages = sections = 0
+    for pdf_path in pdfs:
+        start = time.perf_counter()
+        doc = ParsedDocument(pdf_path)
+        tree = doc.outline_tree
+        doc_seconds.append(time.perf_counter() - start)
+        sections += len(flatten_outline(tree))
+        pages += doc.page_count
+    extract_seconds = sum(doc_seconds)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        start = time.perf_counter()
+        ollama_integration.analyze_collection_with_ollama(
+            input_json, input_json.parent / "PDFs", Path(out_dir) / "output.json",
+            max_workers=workers, use_parse_cache=False)
+        pipeline_seconds = time.perf_counter() - start
+    server.stop()
+    calls = len(server.durations)
+
+    return {
+        "docs": len(pdfs),
+        "pages": pages,
+        "sections": sections,
+        "extract": {
+            "seconds": round(extract_seconds, 3),
+            "pages_per_s": round(pages / extract_seconds, 1) if extract_seconds else 0.0,
+            "sections_per_s": round(sections / extract_seconds, 1) if extract_seconds else 0.0,
+            "doc_p50_ms": round(percentile(doc_seconds, 50) * 1000, 1),
+            "doc_p95_ms": round(percentile(doc_seconds, 95) * 1000, 1),
+        },
+        "pipeline": {
+            "seconds": round(pipeline_seconds, 3),
+            "calls": calls,
+            "calls_per_s": round(calls / pipeline_seconds, 2) if pipeline_seconds else 0.0,
+            "call_p50_ms": round(percentile(server.durations, 50) * 1000, 1),
+            "call_p95_ms": round(percentile(server.durations, 95) * 1000, 1),
+        },
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def metric(results, name):
+    value = results
+    for part in name.split("."):
+        value = value[part]
+    return value
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing each compared metric against the baseline and the list of regressions."""
+    lines, regressions = [], []
+    for corpus, current in results.items():
+        if corpus not in baseline:
+            continue
+        for name, higher_is_better in COMPARED:
+            before, after = metric(baseline[corpus], name), metric(current, name)
+            if not before:
+                continue
+            change = (after - before) / before
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > tolerance else ""
+            lines.append(f"  {corpus:<16} {name:<24} {before:>10} -> {after:>10} {change:>+7.1%} {flag}")
+            if flag:
+                regressions.append((corpus, name))
+    return lines, regressions
+
+
+def print_results(results):
+    print(f"{'corpus':<16} {'docs':>4} {'pages':>5} {'sect':>5} {'pages/s':>8} {'sect/s':>8} "
+          f"{'doc p50':>8} {'doc p95':>8} {'run s':>7} {'calls':>5} {'calls/s':>7} "
+          f"{'call p50':>8} {'call p95':>8} {'RSS MB':>7}")
+    for corpus, r in results.items():
+        e, p = r["extract"], r["pipeline"]
+        print(f"{corpus:<16} {r['docs']:>4} {r['pages']:>5} {r['sections']:>5} {e['pages_per_s']:>8} "
+              f"{e['sections_per_s']:>8} {e['doc_p50_ms']:>6}ms {e['doc_p95_ms']:>6}ms {p['seconds']:>7} "
+              f"{p['calls']:>5} {p['calls_per_s']:>7} {p['call_p50_ms']:>6}ms {p['call_p95_ms']:>6}ms "
+              f"{r['peak_rss_mb']:>7}")
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--worker":
+        print(json.dumps(run_corpus(sys.argv[2], float(sys.argv[3]), int(sys.argv[4]) or None)))
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark extraction and analysis end to end.")
+    parser.add_argument("--docs", type=int, default=5, help="synthetic documents (0: none)")
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic document")
+    parser.add_argument("--headings-per-page", type=int, default=3)
+    parser.add_argument("--collections", nargs="*", default=None,
+                        help="bundled collections to replay (default: every 'Collection *')")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock Ollama latency per call (s)")
+    parser.add_argument("--workers", type=int, default=0, help="extraction processes (0: all cores)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative slowdown tolerated before a metric counts as a regression")
+    args = parser.parse_args()
+
+    collections = (args.collections if args.collections is not None
+                   else sorted(p.name for p in ROOT.glob("Collection *") if p.is_dir()))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        corpora = {}
+        if args.docs:
+            name = f"synthetic-{args.pages}p"
+            corpora[name] = make_synthetic_collection(Path(tmp) / name, args.docs, args.pages,
+                                                      args.headings_per_page)
+        for name in collections:
+            corpora[name] = ROOT / name / "challenge1b_input.json"
+        for name, input_json in corpora.items():
+            out = subprocess.run(
+                [sys.executable, __file__, "--worker", str(input_json), str(args.latency), str(args.workers)],
+                stdout=subprocess.PIPE, text=True, check=True
+            )
+            results[name] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    print_results(results)
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            lines, regressions = compare(results, json.load(f), args.tolerance)
+        print(f"\nAgainst baseline {args.baseline} (tolerance {args.tolerance:.0%}):")
+        print("\n".join(lines) or "  no corpora in common")
+        if regressions:
+            print(f"{len(regressions)} regression(s)")
+            status = 1
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Ollama's streaming /api/generate endpoint.
+
+Answers batch prompts ("- idx: N, heading: ...") with a JSON array of
+{"idx", "summary"} items, any other prompt with a short plain-text summary,
+streamed as JSON lines like the real server ("stream": false gets one JSON
+object). The final message carries `prompt_eval_count` (words of the prompt)
+and `eval_count` (words of the answer), as the real server does. GET
+/api/version reports a server version that supports structured outputs. An
+optional latency (seconds) is added before each response.
+
+For multi-endpoint tests, --servers starts several mocks on consecutive ports.
+--error-rate answers that fraction of generate requests with 503, and setting
+a server's `failing` answers every request, health checks included, with 503.
+
+Usage:
+    python benchmarks/mock_ollama.py [--port 11435] [--latency 0.5]
+    OLLAMA_URL=http://127.0.0.1:11435/api/generate python ollama_integration.py
+    python benchmarks/mock_ollama.py --servers 3 --error-rate 0.1
+    OLLAMA_URLS=http://127.0.0.1:11435/api/generate,http://127.0.0.1:11436/api/generate,... python ...
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_response_text(prompt: str) -> str:
+    idxs = [int(i) for i in re.findall(r'idx: (\d+)', prompt)]
+    if idxs:
+        return json.dumps([{"idx": i, "summary": f"Summary of section {i}."} for i in idxs])
+    return "Summary of the section."
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like Ollama
+    latency = 0.0
+    chunk_chars = 8
+    version = "0.5.7"
+
+    def log_message(self, *args):
+        pass
+
+    def _unavailable(self):
+        body = b'{"error": "server busy"}'
+        self.send_response(503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.server.failing:
+            self._unavailable()
+            return
+        if self.path != "/api/version":
+            self.send_error(404)
+            return
+        body = json.dumps({"version": self.version}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        started = time.perf_counter()
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.server.failing or random.random() < self.server.error_rate:
+            self.server.record_error()
+            self._unavailable()
+            return
+        self.server.record_request(request)
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = request.get("prompt", "")
+        text = make_response_text(prompt)
+        prompt_tokens = len(prompt.split())
+        final = {"model": request.get("model"), "done": True, "prompt_eval_count": prompt_tokens,
+                 "eval_count": len(text.split())}
+        if request.get("stream", True):
+            lines = [
+                json.dumps({"model": request.get("model"), "response": text[i:i + self.chunk_chars], "done": False})
+                for i in range(0, len(text), self.chunk_chars)
+            ]
+            lines.append(json.dumps(dict(final, response="")))
+            body = ("\n".join(lines) + "\n").encode("utf-8")
+            content_type = "application/x-ndjson"
+        else:
+            body = json.dumps(dict(final, response=text)).encode("utf-8")
+            content_type = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.record_duration(time.perf_counter() - started)
+
+
+class MockOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0):
+        handler = type("Handler", (MockOllamaHandler,), {"latency": latency})
+        super().__init__(("127.0.0.1", port), handler)
+        self.error_rate = error_rate
+        self.failing = False
+        self.requests = []
+        self.durations = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record_request(self, request):
+        with self._lock:
+            self.requests.append(request)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record_duration(self, seconds):
+        """Time spent serving one generate request, latency included."""
+        with self._lock:
+            self.durations.append(seconds)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/api/generate"
+
+    def start(self):
+        """Serve on a background thread; returns self for chaining."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama /api/generate server.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--servers", type=int, default=1, help="mock servers on consecutive ports")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of generate requests answered 503")
+    args = parser.parse_args()
+    servers = [MockOllamaServer(args.port + i, args.latency, args.error_rate) for i in range(args.servers)]
+    for server in servers:
+        print(f"Mock Ollama listening on {server.url} (latency {args.latency}s)")
+    if len(servers) > 1:
+        print("OLLAMA_URLS=" + ",".join(server.url for server in servers))
+    for server in servers[1:]:
+        server.start()
+    servers[0].serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Persistent per-collection section index.
+
+Every section of every PDF in a collection directory (heading, page, position
+and body text) is stored once in SQLite together with an inverted index of its
+terms. A document is re-indexed only when its file changes (size/mtime, then
+content hash) or index_version() moves on (the extractor version, OUTLINE_USE_TOC
+and the token budgets of the stored text), so repeated persona/job queries
+against the same collection never parse a PDF again. query() scores with BM25
+straight from the postings of the query terms, which takes milliseconds.
+
+Usage:
+    python collection_index.py build "Collection 1"
+    python collection_index.py query "Collection 1" --persona "Travel Planner" --job "Plan a trip" [-k 10]
+    python collection_index.py stats
+"""
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from parse_cache import file_digest
+from process_pdfs import extractor_version
+from retrieval import (EXCERPT_TOKEN_BUDGET, INDEX_TOKEN_BUDGET, RETRIEVAL_TOP_K, build_query, section_document,
+                       tokenize)
+
+COLLECTION_INDEX_PATH = os.environ.get(
+    "COLLECTION_INDEX_PATH", str(Path(__file__).parent / ".cache" / "collection_index.sqlite")
+)
+
+
+def index_version() -> str:
+    """What an indexed document was built with; a document indexed under another version is stale."""
+    return f"{extractor_version()}:{INDEX_TOKEN_BUDGET}:{EXCERPT_TOKEN_BUDGET}"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS documents ("
+    " collection TEXT, name TEXT, size INTEGER, mtime_ns INTEGER, digest TEXT, version TEXT,"
+    " indexed_at REAL, PRIMARY KEY (collection, name))",
+    "CREATE TABLE IF NOT EXISTS sections ("
+    " id INTEGER PRIMARY KEY, collection TEXT, document TEXT, position INTEGER, length INTEGER, data TEXT)",
+    "CREATE INDEX IF NOT EXISTS sections_document ON sections (collection, document)",
+    "CREATE TABLE IF NOT EXISTS postings (term TEXT, section_id INTEGER, tf INTEGER)",
+    "CREATE INDEX IF NOT EXISTS postings_term ON postings (term, section_id)",
+    "CREATE INDEX IF NOT EXISTS postings_section ON postings (section_id)",
+)
+
+
+class CollectionIndex:
+    """
+    Section index of one collection's PDF directory, safe to share across threads.
+
+    Usage:
+        index = CollectionIndex("Collection 1/PDFs")
+        for name in index.stale(names):
+            index.add_document(name, sections_of(name))
+        hits = index.query(persona, job, k=10, documents=names)  # [(score, section)]
+    """
+
+    kind = "bm25-index"
+
+    def __init__(self, pdf_dir, path=COLLECTION_INDEX_PATH, k1=1.5, b=0.75):
+        self.pdf_dir = Path(pdf_dir)
+        self.collection = str(self.pdf_dir.resolve())
+        self.k1 = k1
+        self.b = b
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def stale(self, names):
+        """The documents among names that are missing from the index or changed since indexing."""
+        with self._lock:
+            known = {
+                name: (size, mtime_ns, digest, version)
+                for name, size, mtime_ns, digest, version in self._conn.execute(
+                    "SELECT name, size, mtime_ns, digest, version FROM documents WHERE collection = ?",
+                    (self.collection,)
+                )
+            }
+        stale = []
+        for name in names:
+            path = self.pdf_dir / name
+            record = known.get(name)
+            if record is None or record[3] != index_version() or not path.exists():
+                stale.append(name)
+                continue
+            stat = path.stat()
+            if (record[0], record[1]) != (stat.st_size, stat.st_mtime_ns):
+                # Touched or copied: only re-index when the content really changed
+                if file_digest(self.pdf_dir / name) != record[2]:
+                    stale.append(name)
+                else:
+                    with self._lock:
+                        self._conn.execute(
+                            "UPDATE documents SET size = ?, mtime_ns = ? WHERE collection = ? AND name = ?",
+                            (stat.st_size, stat.st_mtime_ns, self.collection, name)
+                        )
+                        self._conn.commit()
+        return stale
+
+    def add_document(self, name, sections):
+        """Index (or re-index) one document's sections, as produced by prepare_sections."""
+        stat = (self.pdf_dir / name).stat()
+        digest = file_digest(self.pdf_dir / name)
+        with self._lock:
+            self._delete(name)
+            for position, section in enumerate(sections):
+                term_freqs = Counter(tokenize(section_document(section)))
+                cur = self._conn.execute(
+                    "INSERT INTO sections (collection, document, position, length, data) VALUES (?, ?, ?, ?, ?)",
+                    (self.collection, name, position, sum(term_freqs.values()),
+                     json.dumps(section, ensure_ascii=False))
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, section_id, tf) VALUES (?, ?, ?)",
+                    [(term, cur.lastrowid, tf) for term, tf in term_freqs.items()]
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (collection, name, size, mtime_ns, digest, version, indexed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.collection, name, stat.st_size, stat.st_mtime_ns, digest, index_version(), time.time())
+            )
+            self._conn.commit()
+
+    def prune(self):
+        """Drop the documents whose PDF no longer exists; returns their names."""
+        with self._lock:
+            names = [row[0] for row in self._conn.execute(
+                "SELECT name FROM documents WHERE collection = ?", (self.collection,))]
+        removed = [name for name in names if not (self.pdf_dir / name).exists()]
+        for name in removed:
+            self.remove_document(name)
+        return removed
+
+    def remove_document(self, name):
+        with self._lock:
+            self._delete(name)
+            self._conn.commit()
+
+    def _delete(self, name):
+        ids = [row[0] for row in self._conn.execute(
+            "SELECT id FROM sections WHERE collection = ? AND document = ?", (self.collection, name)
+        )]
+        self._conn.executemany("DELETE FROM postings WHERE section_id = ?", [(i,) for i in ids])
+        self._conn.execute("DELETE FROM sections WHERE collection = ? AND document = ?", (self.collection, name))
+        self._conn.execute("DELETE FROM documents WHERE collection = ? AND name = ?", (self.collection, name))
+
+    def _scope(self, documents):
+        """SQL condition and parameters restricting sections to this collection (and documents)."""
+        if documents is None:
+            return "s.collection = ?", [self.collection]
+        documents = list(documents)
+        marks = ",".join("?" * len(documents))
+        return f"s.collection = ? AND s.document IN ({marks})", [self.collection, *documents]
+
+    def sections(self, documents=None):
+        """Stored sections, in document order (as given) and reading order within each document."""
+        where, params = self._scope(documents)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT s.document, s.data FROM sections s WHERE {where} ORDER BY s.id", params
+            ).fetchall()
+        order = {name: i for i, name in enumerate(documents or ())}
+        rows.sort(key=lambda row: order.get(row[0], len(order)))
+        return [json.loads(data) for _, data in rows]
+
+    def search(self, query: str, k=RETRIEVAL_TOP_K, documents=None):
+        """Top-k (score, section) pairs by BM25, best first; ties keep document order."""
+        where, params = self._scope(documents)
+        terms = sorted(set(tokenize(query)))
+        with self._lock:
+            n, avg_length = self._conn.execute(
+                f"SELECT COUNT(*), AVG(s.length) FROM sections s WHERE {where}", params
+            ).fetchone()
+            if not n:
+                return []
+            postings = self._conn.execute(
+                f"SELECT p.section_id, p.term, p.tf, s.length FROM postings p JOIN sections s ON s.id = p.section_id"
+                f" WHERE {where} AND p.term IN ({','.join('?' * len(terms))})", params + terms
+            ).fetchall() if terms else []
+        doc_freq = Counter(term for _, term, _, _ in postings)
+        idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in doc_freq.items()}
+        scores = Counter()
+        for section_id, term, tf, length in postings:
+            norm = self.k1 * (1 - self.b + self.b * length / avg_length) if avg_length else self.k1
+            scores[section_id] += idf[term] * tf * (self.k1 + 1) / (tf + norm)
+
+        # Rank on (score, document order, position); pad with unscored sections like BM25Index
+        order = {name: i for i, name in enumerate(documents or ())}
+        with self._lock:
+            keys = {
+                section_id: (order.get(document, len(order)), section_id)
+                for section_id, document in self._conn.execute(
+                    f"SELECT s.id, s.document FROM sections s WHERE {where}", params
+                )
+            }
+        ranked = sorted(keys, key=lambda i: (-scores.get(i, 0.0), keys[i]))[:k]
+        with self._lock:
+            data = dict(self._conn.execute(
+                f"SELECT id, data FROM sections WHERE id IN ({','.join('?' * len(ranked))})", ranked
+            ).fetchall())
+        return [(scores.get(i, 0.0), json.loads(data[i])) for i in ranked]
+
+    def query(self, persona, job_to_be_done, k=RETRIEVAL_TOP_K, documents=None):
+        """Ranked (score, section) pairs for a persona and job."""
+        return self.search(build_query(persona, job_to_be_done), k, documents)
+
+    def view(self, documents):
+        """This index restricted to documents, with SectionIndex's search(query, k)."""
+        return _IndexView(self, list(documents))
+
+    def count(self, documents=None) -> int:
+        where, params = self._scope(documents)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM sections s WHERE {where}", params).fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            docs, = self._conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE collection = ?", (self.collection,)).fetchone()
+            sections, = self._conn.execute(
+                "SELECT COUNT(*) FROM sections WHERE collection = ?", (self.collection,)).fetchone()
+        return {"collection": self.collection, "documents": docs, "sections": sections, "path": str(self.path)}
+
+
+class _IndexView:
+    def __init__(self, index, documents):
+        self.index = index
+        self.documents = documents
+        self.kind = index.kind
+
+    def __len__(self):
+        return self.index.count(self.documents)
+
+    def search(self, query, k=RETRIEVAL_TOP_K):
+        return self.index.search(query, k, self.documents)
+
+
+def update_collection(index, names, parse):
+    """Re-index the stale documents among names; parse(pdf_path) returns a document's sections."""
+    index.prune()
+    stale = index.stale(names)
+    for name in stale:
+        index.add_document(name, parse(index.pdf_dir / name))
+    return stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the persistent collection index.")
+    parser.add_argument("command", choices=["build", "query", "stats"])
+    parser.add_argument("collection", nargs="?", help="collection directory (containing PDFs/)")
+    parser.add_argument("--persona", default="")
+    parser.add_argument("--job", default="")
+    parser.add_argument("-k", type=int, default=RETRIEVAL_TOP_K)
+    args = parser.parse_args()
+
+    if args.command == "stats" and not args.collection:
+        with sqlite3.connect(COLLECTION_INDEX_PATH) as conn:
+            rows = conn.execute(
+                "SELECT collection, COUNT(*) FROM documents GROUP BY collection ORDER BY collection").fetchall()
+        for collection, docs in rows:
+            print(f"{collection}: {docs} document(s)")
+        return
+    if not args.collection:
+        parser.error("a collection directory is required")
+    index = CollectionIndex(Path(args.collection) / "PDFs")
+    if args.command == "build":
+        # Imported here: building needs the parser and section preparation, querying does not
+        from ollama_integration import prepare_sections
+        from parse_cache import ParseCache, load_parsed
+
+        cache = ParseCache()
+        names = sorted(p.name for p in index.pdf_dir.glob("*.pdf"))
+        started = time.perf_counter()
+        stale = update_collection(index, names, lambda p: prepare_sections(p.name, load_parsed(p, cache)))
+        print(f"Re-indexed {len(stale)} of {len(names)} document(s) in {time.perf_counter() - started:.2f}s")
+        print(json.dumps(index.stats(), indent=2))
+    elif args.command == "query":
+        started = time.perf_counter()
+        hits = index.query(args.persona, args.job, args.k)
+        elapsed = (time.perf_counter() - started) * 1000
+        for rank, (score, section) in enumerate(hits, start=1):
+            print(f"{rank:>3}. {score:6.2f}  {section['document']} p.{section['page']}: {section['text']}")
+        print(f"{len(hits)} section(s) in {elapsed:.1f} ms")
+    else:
+        print(json.dumps(index.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
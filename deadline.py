@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Wall-clock budget for a run and the cost estimates used to stay within it.
+
+A Deadline is fixed when the run starts (RUN_DEADLINE seconds, or --deadline)
+and keeps DEADLINE_MARGIN seconds in reserve for ranking and writing outputs.
+CostModel predicts parse time from page counts and model-call time from the
+number of sections in a batch. It starts from conservative priors and follows
+the observed latencies (exponential moving averages), so a slow server is
+noticed after its first calls.
+
+The pipeline uses both to decide, before and during summarization, how many
+top-ranked sections can still go to the model; everything else is summarized
+extractively, so a valid output is always written on time.
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+
+RUN_DEADLINE = float(os.environ.get("RUN_DEADLINE", "0"))  # seconds for the whole run; 0 = no deadline
+DEADLINE_MARGIN = float(os.environ.get("DEADLINE_MARGIN", "1.5"))
+# Priors until calls and parses have been observed
+PRIOR_CALL_SECONDS = float(os.environ.get("PRIOR_CALL_SECONDS", "2.0"))
+PRIOR_SECTION_SECONDS = float(os.environ.get("PRIOR_SECTION_SECONDS", "1.5"))
+PRIOR_PAGE_SECONDS = float(os.environ.get("PRIOR_PAGE_SECONDS", "0.02"))
+# Weight of the newest observation in the moving averages
+COST_SMOOTHING = 0.3
+
+
+class Deadline:
+    """
+    Usage:
+        deadline = Deadline(60)
+        if deadline.allows(estimated_seconds): ...
+        await asyncio.wait_for(work, deadline.remaining())
+    """
+
+    def __init__(self, seconds, margin=DEADLINE_MARGIN, started=None):
+        self.seconds = seconds
+        self.margin = margin
+        self.started = time.perf_counter() if started is None else started
+
+    def remaining(self) -> float:
+        """Seconds left for work, the margin excluded (never negative)."""
+        return max(0.0, self.started + self.seconds - self.margin - time.perf_counter())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, seconds) -> bool:
+        return seconds <= self.remaining()
+
+    def timeout(self, default):
+        """default, shortened to the time left."""
+        return min(default, self.remaining()) if default else self.remaining()
+
+
+def start_deadline(seconds=RUN_DEADLINE, started=None):
+    """A Deadline for seconds, or None when seconds is 0 (no deadline)."""
+    return Deadline(seconds, started=started) if seconds and seconds > 0 else None
+
+
+class CostModel:
+    """Observed-latency estimates of parse and model-call time; safe to share across threads."""
+
+    def __init__(self, call_seconds=PRIOR_CALL_SECONDS, section_seconds=PRIOR_SECTION_SECONDS,
+                 page_seconds=PRIOR_PAGE_SECONDS):
+        self.base = call_seconds
+        self.per_section = section_seconds
+        self.per_page = page_seconds
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _smooth(current, observed):
+        return (1 - COST_SMOOTHING) * current + COST_SMOOTHING * observed
+
+    def observe_call(self, sections, seconds):
+        """A model call over sections that took seconds, as seen by the caller."""
+        with self._lock:
+            self.calls += 1
+            if sections <= 1:
+                self.base = self._smooth(self.base, seconds)
+            else:
+                # Split the call between fixed cost and per-section output
+                self.per_section = self._smooth(self.per_section, max(0.0, seconds - self.base) / sections)
+
+    def observe_parse(self, pages, seconds):
+        if pages:
+            with self._lock:
+                self.per_page = self._smooth(self.per_page, seconds / pages)
+
+    def call_seconds(self, sections) -> float:
+        return self.base + self.per_section * max(0, sections - 1)
+
+    def parse_seconds(self, pages) -> float:
+        return self.per_page * pages
+
+    def summarize_seconds(self, sections_per_document, parallel=1) -> float:
+        """Time for one model call per document, parallel calls at a time."""
+        calls = [self.call_seconds(n) for n in sections_per_document if n]
+        if not calls:
+            return 0.0
+        return max(max(calls), sum(calls) / max(1, parallel))
+
+
+default_costs = CostModel()
+
+
+def fit_llm_sections(ranked_sections, llm_sections, deadline, parallel=1, costs=default_costs):
+    """
+    The llm_sections rank limit cut to the deadline: the rank of the last of the most
+    top-ranked sections (within llm_sections; negative: all) whose model calls are
+    expected to finish in time; 0 if none fit. Ranks may have gaps, e.g. where near
+    duplicates were dropped.
+    """
+    if deadline is None:
+        return llm_sections
+    ranks = [section.get("rank") or position for position, section in enumerate(ranked_sections, start=1)]
+    limit = len(ranks) if llm_sections < 0 else sum(rank <= llm_sections for rank in ranks)
+    for k in range(limit, 0, -1):
+        per_document = Counter(section["document"] for section in ranked_sections[:k])
+        if deadline.allows(costs.summarize_seconds(per_document.values(), parallel)):
+            return ranks[k - 1]
+    return 0
+
+
+def client_parallelism(client) -> int:
+    """How many model calls a backend runs at once."""
+    return getattr(client, "max_in_flight", None) or getattr(client, "batch_size", None) or 1
+
+
+def parse_reserve(llm_sections, deadline, costs=default_costs) -> float:
+    """Time to keep back from parsing for the model calls (at most half the time left)."""
+    if deadline is None or not llm_sections:
+        return 0.0
+    return min(costs.call_seconds(llm_sections if llm_sections > 0 else 10), deadline.remaining() / 2)
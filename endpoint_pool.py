@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Load balancing, circuit breaking and per-endpoint statistics for several
+Ollama servers (OLLAMA_URLS).
+
+Each call goes to the least-loaded available endpoint: the one with the lowest
+(requests in flight + 1) * moving-average latency, where an endpoint without
+a finished call yet counts with the average of the others. A call that fails
+is retried on another endpoint. After BREAKER_FAILURES consecutive failures
+(or a failed health check) an endpoint's breaker opens. The endpoint then gets
+no traffic for BREAKER_COOLDOWN seconds. After that a single trial call is let
+through, and its success (or a passing health check) closes the breaker again. When every endpoint is open, calls
+still go to them in order rather than being dropped.
+
+Timeouts move the latency average but do not count as failures: a call may be
+cut short by the run's deadline rather than by the server.
+
+Calls can name an affinity key, such as their shared prompt prefix. An endpoint
+remembers the last PREFIX_AFFINITY_KEYS keys it was given, and a call with one of
+them goes back to that endpoint, whose prompt cache already holds the prefix,
+unless its load is more than PREFIX_AFFINITY_SLACK times the least load.
+
+The pool only keeps state; it is thread-safe and is used by both the async
+client (ollama_client) and the synchronous call path.
+"""
+
+import os
+import threading
+import time
+
+BREAKER_FAILURES = int(os.environ.get("OLLAMA_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.environ.get("OLLAMA_BREAKER_COOLDOWN", "15"))
+# Weight of the newest call in an endpoint's latency average
+LATENCY_SMOOTHING = 0.3
+PREFIX_AFFINITY_KEYS = 8
+PREFIX_AFFINITY_SLACK = float(os.environ.get("OLLAMA_PREFIX_AFFINITY_SLACK", "2"))
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url
+        self.in_flight = 0
+        self.latency = None  # moving average of call seconds; None until a call finished
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial = False  # a half-open trial call is in flight
+        self.busy_seconds = 0.0
+        self.output_tokens = 0
+        self.affinity = []  # recent affinity keys, newest last
+
+    def state(self, now) -> str:
+        if now < self.open_until:
+            return "open"
+        if self.consecutive_failures >= BREAKER_FAILURES:
+            return "half-open"
+        return "closed"
+
+    def load(self, default_latency) -> float:
+        latency = self.latency if self.latency is not None else default_latency
+        return (self.in_flight + 1) * latency
+
+
+class EndpointPool:
+    """
+    Usage:
+        endpoint = pool.acquire(tried, affinity=prefix)   # None once every endpoint was tried
+        ... request endpoint.url ...
+        pool.succeeded(endpoint, seconds) / pool.timed_out(endpoint, seconds) / pool.failed(endpoint)
+        # or pool.cancelled(endpoint) when the call was abandoned; exactly one of them per acquire
+    """
+
+    def __init__(self, urls):
+        if isinstance(urls, str):
+            urls = [urls]
+        self.endpoints = [Endpoint(url) for url in dict.fromkeys(urls)]
+        if not self.endpoints:
+            raise ValueError("no Ollama endpoints configured")
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def acquire(self, tried=(), affinity=None):
+        """
+        The endpoint for the next attempt of a call (counted as in flight), skipping tried
+        ones; with an affinity key, preferably one that was given the same key before.
+        """
+        with self._lock:
+            now = time.monotonic()
+            untried = [e for e in self.endpoints if e not in tried]
+            if not untried:
+                return None
+            available = [e for e in untried
+                         if e.state(now) == "closed" or (e.state(now) == "half-open" and not e.trial)]
+            if available:
+                known = [e.latency for e in available if e.latency is not None]
+                default_latency = sum(known) / len(known) if known else 1.0
+                endpoint = min(available, key=lambda e: (e.load(default_latency), e.in_flight))
+                if affinity is not None:
+                    least = endpoint.load(default_latency)
+                    warm = [e for e in available if affinity in e.affinity
+                            and e.load(default_latency) <= PREFIX_AFFINITY_SLACK * least]
+                    if warm:
+                        endpoint = min(warm, key=lambda e: (e.load(default_latency), e.in_flight))
+                if endpoint.state(now) == "half-open":
+                    endpoint.trial = True
+            else:
+                # Everything is open or on trial: still better than dropping the call
+                endpoint = min(untried, key=lambda e: e.open_until)
+            endpoint.in_flight += 1
+            if affinity is not None:
+                if affinity in endpoint.affinity:
+                    endpoint.affinity.remove(affinity)
+                endpoint.affinity = endpoint.affinity[-(PREFIX_AFFINITY_KEYS - 1):] + [affinity]
+            return endpoint
+
+    def available(self) -> int:
+        """Endpoints currently taking traffic (breaker not open)."""
+        with self._lock:
+            now = time.monotonic()
+            return sum(e.state(now) != "open" for e in self.endpoints)
+
+    def cancelled(self, endpoint):
+        """Release an attempt that was abandoned before it succeeded or failed."""
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.trial = False
+
+    def _release(self, endpoint, seconds):
+        endpoint.in_flight -= 1
+        endpoint.trial = False
+        endpoint.busy_seconds += seconds
+
+    def _observe(self, endpoint, seconds):
+        endpoint.latency = (seconds if endpoint.latency is None
+                            else (1 - LATENCY_SMOOTHING) * endpoint.latency + LATENCY_SMOOTHING * seconds)
+
+    def succeeded(self, endpoint, seconds, output_tokens=0):
+        with self._lock:
+            self._release(endpoint, seconds)
+            self._observe(endpoint, seconds)
+            endpoint.calls += 1
+            endpoint.output_tokens += output_tokens or 0
+            endpoint.consecutive_failures = 0
+            endpoint.open_until = 0.0
+
+    def timed_out(self, endpoint, seconds):
+        with self._lock:
+            self._release(endpoint, seconds)
+            self._observe(endpoint, seconds)
+            endpoint.timeouts += 1
+
+    def failed(self, endpoint, seconds=0.0) -> bool:
+        """Record a failed call; True when it opened the endpoint's breaker."""
+        with self._lock:
+            self._release(endpoint, seconds)
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            now = time.monotonic()
+            if endpoint.consecutive_failures < BREAKER_FAILURES:
+                return False
+            opened = endpoint.state(now) != "open"
+            endpoint.open_until = now + BREAKER_COOLDOWN
+            return opened
+
+    def checked(self, endpoint, healthy) -> bool:
+        """Record a health check; True when it changed whether the endpoint takes traffic."""
+        with self._lock:
+            now = time.monotonic()
+            was_closed = endpoint.state(now) == "closed"
+            if healthy:
+                if not was_closed:
+                    endpoint.consecutive_failures = 0
+                    endpoint.open_until = 0.0
+                return not was_closed
+            endpoint.consecutive_failures = max(endpoint.consecutive_failures, BREAKER_FAILURES)
+            endpoint.open_until = now + BREAKER_COOLDOWN
+            return was_closed
+
+    def stats(self):
+        """Per-endpoint state, call counts, latency and throughput since the pool was created."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = max(1e-9, time.perf_counter() - self.started)
+            return [{
+                "url": e.url, "state": e.state(now), "in_flight": e.in_flight, "calls": e.calls,
+                "failures": e.failures, "timeouts": e.timeouts,
+                "latency_ms": round(e.latency * 1000, 1) if e.latency is not None else None,
+                "calls_per_s": round(e.calls / elapsed, 3),
+                "output_tokens_per_s": round(e.output_tokens / elapsed, 1),
+                "busy": round(e.busy_seconds / elapsed, 3),
+            } for e in self.endpoints]
+
+    def summary(self) -> str:
+        lines = [f"  {'endpoint':<40} {'state':>9} {'calls':>6} {'failed':>6} {'timeouts':>8} "
+                 f"{'latency':>9} {'calls/s':>8} {'tokens/s':>9}"]
+        for s in self.stats():
+            latency = f"{s['latency_ms']:.0f}ms" if s["latency_ms"] is not None else "-"
+            lines.append(f"  {s['url']:<40} {s['state']:>9} {s['calls']:>6} {s['failures']:>6} {s['timeouts']:>8} "
+                         f"{latency:>9} {s['calls_per_s']:>8.2f} {s['output_tokens_per_s']:>9.1f}")
+        return "\n".join(lines)
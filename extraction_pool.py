@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Multi-process PDF extraction.
+
+PDF decoding is CPU-bound and holds the GIL, so documents are parsed in a
+process pool. Documents longer than PAGES_PER_CHUNK pages are split into page
+ranges that are decoded by different workers and reassembled in the parent.
+Results are parse_cache entries (outline tree, text lines, section line
+ranges) and are yielded as soon as each document is done, so the caller can
+consume them while the remaining documents are still being parsed.
+
+With outline_only, as used by the outline extractor (process_pdfs.py), each
+document is instead streamed page by page through extract_outline_tree, which
+keeps memory flat in document length and can stop early (max_sections); the
+entries then hold only the tree, page count and outline source.
+"""
+
+import concurrent.futures
+import os
+import time
+from pathlib import Path
+
+import tracing
+from process_pdfs import (OUTLINE_MAX_SECTIONS, ParsedDocument, extract_outline_tree, outline_source,
+                          pdf_page_count, read_pages)
+from parse_cache import document_entry, parse_entry
+
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+PAGES_PER_CHUNK = int(os.environ.get("PAGES_PER_CHUNK", "40"))
+
+
+# Worker results also carry the trace events recorded in the worker (see tracing.drain)
+
+def _timed_parse_entry(pdf_path):
+    start = time.perf_counter()
+    entry = parse_entry(pdf_path)
+    return entry, time.perf_counter() - start, tracing.drain()
+
+
+def _timed_outline_entry(pdf_path, max_sections):
+    start = time.perf_counter()
+    tree = extract_outline_tree(pdf_path, max_sections=max_sections)
+    entry = {"tree": tree, "outline_source": outline_source(tree)}
+    return entry, time.perf_counter() - start, tracing.drain()
+
+
+def _timed_read_pages(pdf_path, start_page, stop_page):
+    start = time.perf_counter()
+    # The first range also reads the embedded outline, so the parent never opens the file
+    part = read_pages(pdf_path, start_page, stop_page, with_toc=start_page == 0)
+    return part, time.perf_counter() - start, tracing.drain()
+
+
+class ExtractionPool:
+    """
+    Usage:
+        with ExtractionPool(parse_cache=cache) as pool:   # or ExtractionPool(outline_only=True)
+            for pdf_path, entry in pool.iter_completed(paths):
+                ...
+        pool.timings  # {pdf_path: {"seconds": ..., "pages": ..., "chunks": ..., "cached": ...}}
+
+    "seconds" is the time from the start of iter_completed until the document was ready.
+    """
+
+    def __init__(self, workers=EXTRACT_WORKERS, pages_per_chunk=PAGES_PER_CHUNK, parse_cache=None,
+                 outline_only=False, max_sections=OUTLINE_MAX_SECTIONS):
+        self.workers = workers
+        self.pages_per_chunk = pages_per_chunk
+        self.parse_cache = parse_cache
+        self.outline_only = outline_only
+        self.max_sections = max_sections
+        self.timings = {}
+        self._executor = None
+
+    def __enter__(self):
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exc):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+    def _record(self, pdf_path, **timing):
+        self.timings[str(pdf_path)] = timing
+
+    def iter_completed(self, pdf_paths, errors=None):
+        """
+        Yield (pdf_path, entry) for each document as soon as its extraction finishes.
+        Cached documents come first; large documents are reassembled here once their
+        last page range is decoded. A document that fails to parse raises, unless an
+        errors list is given: (pdf_path, exception) is then appended and it is skipped.
+        """
+        started = time.perf_counter()
+        pending = {}  # future -> (pdf_path, chunk index or None)
+        chunked = {}  # pdf_path -> {"parts": [...], "left": n, "worker_seconds": s, "key": k}
+        keys = {}
+        page_counts = {}  # outline_only: pages counted here, not in the worker
+        for pdf_path in map(Path, pdf_paths):
+            if self.parse_cache is not None:
+                keys[pdf_path] = self.parse_cache.key_for(pdf_path)
+                entry = self.parse_cache.get(keys[pdf_path])
+                if entry is not None:
+                    self._record(pdf_path, seconds=time.perf_counter() - started,
+                                 pages=entry.get("page_count"), chunks=0, cached=True,
+                                 outline=entry.get("outline_source"))
+                    yield pdf_path, entry
+                    continue
+            try:
+                pages = pdf_page_count(pdf_path)
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors.append((pdf_path, e))
+                continue
+            if self.outline_only:
+                page_counts[pdf_path] = pages
+                pending[self._executor.submit(_timed_outline_entry, pdf_path, self.max_sections)] = (pdf_path, None)
+                continue
+            if pages <= self.pages_per_chunk:
+                pending[self._executor.submit(_timed_parse_entry, pdf_path)] = (pdf_path, None)
+                continue
+            ranges = [(s, min(s + self.pages_per_chunk, pages)) for s in range(0, pages, self.pages_per_chunk)]
+            chunked[pdf_path] = {"parts": [None] * len(ranges), "left": len(ranges), "worker_seconds": 0.0}
+            for i, (start, stop) in enumerate(ranges):
+                pending[self._executor.submit(_timed_read_pages, pdf_path, start, stop)] = (pdf_path, i)
+
+        failed = set()
+        for future in concurrent.futures.as_completed(pending):
+            pdf_path, chunk = pending[future]
+            if pdf_path in failed:
+                continue
+            try:
+                result = future.result()
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors.append((pdf_path, e))
+                failed.add(pdf_path)
+                continue
+            if chunk is None:
+                entry, worker_seconds, trace = result
+                tracing.merge(trace)
+                n_chunks = 1
+                if pdf_path in page_counts:
+                    entry["page_count"] = page_counts[pdf_path]
+            else:
+                state = chunked[pdf_path]
+                state["parts"][chunk], seconds, trace = result
+                tracing.merge(trace)
+                state["worker_seconds"] += seconds
+                state["left"] -= 1
+                if state["left"]:
+                    continue
+                with tracing.span("pdf.reassemble", document=pdf_path.name, chunks=len(state["parts"])):
+                    parts = state["parts"]
+                    toc = parts[0][2]
+                    parts[0] = parts[0][:2]
+                    doc = ParsedDocument.from_parts(pdf_path, parts, toc=toc)
+                    entry = document_entry(doc)
+                worker_seconds = state["worker_seconds"]
+                n_chunks = len(state["parts"])
+                del chunked[pdf_path]
+            # Outline-only entries lack the section text a cache entry must hold
+            if self.parse_cache is not None and not self.outline_only:
+                self.parse_cache.put(keys[pdf_path], entry, source=pdf_path)
+            self._record(pdf_path, seconds=time.perf_counter() - started, worker_seconds=worker_seconds,
+                         pages=entry.get("page_count"), chunks=n_chunks, cached=False,
+                         outline=entry.get("outline_source"))
+            yield pdf_path, entry
+
+    def summary(self) -> str:
+        lines = []
+        for path, t in sorted(self.timings.items(), key=lambda kv: kv[1]["seconds"]):
+            source = "cache" if t["cached"] else f"{t['chunks']} chunk(s)"
+            if t.get("outline"):
+                source += f", outline from {t['outline']}"
+            worker = f", {t['worker_seconds']:.3f}s in workers" if "worker_seconds" in t else ""
+            lines.append(f"  {Path(path).name}: ready at {t['seconds']:.3f}s{worker}, {t['pages']} pages, {source}")
+        return "\n".join(lines)
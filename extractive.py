@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Extractive section summaries, computed on the CPU without a model.
+
+A section body is split into sentences; each sentence is scored by how many
+distinct persona/job query terms it contains, discounted by its length, with a
+small bonus for coming early in the section. The best sentences are returned in
+their original order, so the summary reads like the source text. Fragments
+with fewer than EXTRACTIVE_MIN_WORDS words, such as a lone bullet glyph, are
+never chosen; a body without a real sentence is summarized by its heading.
+"""
+
+import math
+import os
+import re
+
+from retrieval import tokenize
+
+EXTRACTIVE_SENTENCES = int(os.environ.get("EXTRACTIVE_SENTENCES", "3"))
+EXTRACTIVE_MAX_CHARS = int(os.environ.get("EXTRACTIVE_MAX_CHARS", "600"))
+EXTRACTIVE_MIN_WORDS = int(os.environ.get("EXTRACTIVE_MIN_WORDS", "3"))
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+|\s*\n\s*(?=[•\-*]|\d+[.)]\s)')
+# A word: two or more letters, so bullet glyphs ("•", "o") and numbers do not count
+_WORD_RE = re.compile(r'[^\W\d_]{2,}')
+
+
+def split_sentences(text: str):
+    """Sentences (and bullet items) of text, whitespace-normalized."""
+    sentences = []
+    for part in _SENTENCE_RE.split(text):
+        sentence = " ".join(part.split())
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+def extractive_summary(text: str, query: str, max_sentences=EXTRACTIVE_SENTENCES,
+                       max_chars=EXTRACTIVE_MAX_CHARS, fallback="") -> str:
+    """Up to max_sentences sentences of text that best cover the query, in text order."""
+    sentences = [s for s in split_sentences(text) if len(_WORD_RE.findall(s)) >= EXTRACTIVE_MIN_WORDS]
+    if not sentences:
+        return fallback.strip()
+    terms = set(tokenize(query))
+    scored = []
+    for position, sentence in enumerate(sentences):
+        words = tokenize(sentence)
+        overlap = len(terms.intersection(words))
+        score = overlap / math.sqrt(len(words) + 1) + 0.1 / (position + 1)
+        scored.append((score, position))
+    chosen = sorted(position for _, position in sorted(scored, reverse=True)[:max_sentences])
+    summary = ""
+    for position in chosen:
+        candidate = f"{summary} {sentences[position]}".strip()
+        if summary and len(candidate) > max_chars:
+            break
+        summary = candidate
+    return summary[:max_chars]
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Interchangeable LLM backends.
+
+Every backend is an async context manager with the AsyncOllamaClient interface:
+generate(prompt, options, timeout, format, on_text, prefix, cache_if) returning
+the completion text ("" on failure), a `calls` counter and a `structured_format`
+attribute. prefix names the fixed start of prompt shared by many calls: the
+local backend keeps its KV cache, and the Ollama backend sends the call to a
+server whose prompt cache already holds it. cache_if, if given,
+decides from a response whether it goes into the response cache.
+The in-process backends also offer a synchronous complete(...).
+
+LLM_BACKEND selects the implementation:
+    ollama  HTTP calls to the Ollama server at OLLAMA_URL (default), or balanced
+            over several servers listed in OLLAMA_URLS
+    local   a small Hugging Face model (LOCAL_MODEL) loaded once in this process;
+            concurrent requests are grouped into batched generate() calls.
+            Needs `pip install transformers torch`.
+    stub    deterministic answers built from the prompt itself, no model at all;
+            for tests and benchmarks (LLM_STUB_LATENCY adds a fixed delay per call)
+"""
+
+import asyncio
+import copy
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+import tracing
+from llm_cache import default_cache
+from ollama_client import AsyncOllamaClient, OLLAMA_MAX_IN_FLIGHT, OLLAMA_TIMEOUT, debug, log
+
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "ollama")
+LOCAL_MODEL = os.environ.get("LOCAL_MODEL", "google/gemma-3-1b-it")
+LOCAL_BATCH_SIZE = int(os.environ.get("LOCAL_BATCH_SIZE", "8"))
+LOCAL_BATCH_WAIT_MS = float(os.environ.get("LOCAL_BATCH_WAIT_MS", "20"))
+LOCAL_THREADS = int(os.environ.get("LOCAL_THREADS", str(os.cpu_count() or 1)))
+LOCAL_MAX_NEW_TOKENS = int(os.environ.get("LOCAL_MAX_NEW_TOKENS", "256"))
+LLM_STUB_LATENCY = float(os.environ.get("LLM_STUB_LATENCY", "0"))
+# Prompt prefixes whose KV cache the local backend keeps
+LOCAL_PREFIX_CACHES = int(os.environ.get("LOCAL_PREFIX_CACHES", "4"))
+
+_SECTION_LINE_RE = re.compile(r'^- idx: (\d+), heading: (.*?), excerpt: (.*)$', re.MULTILINE)
+
+
+def stub_summary(heading: str, excerpt: str) -> str:
+    """First sentence of the excerpt (at most 200 characters), else the heading."""
+    text = " ".join(excerpt.split())
+    if not text:
+        return heading.strip()
+    sentence = re.split(r'(?<=[.!?])\s', text, maxsplit=1)[0]
+    return sentence[:200]
+
+
+class StubBackend:
+    """Deterministic stand-in for a model: answers are derived from the prompt text."""
+
+    name = "stub"
+    model = "stub"
+    structured_format = None
+
+    def __init__(self, latency=LLM_STUB_LATENCY, **_):
+        self.latency = latency
+        self.calls = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def _answer(self, prompt, on_text):
+        self.calls += 1
+        sections = _SECTION_LINE_RE.findall(prompt)
+        if sections:
+            result = json.dumps([
+                {"idx": int(idx), "summary": stub_summary(heading, excerpt)}
+                for idx, heading, excerpt in sections
+            ])
+        else:
+            result = " ".join(prompt.split())[:200]
+        if on_text is not None:
+            on_text(result)
+        return result
+
+    def complete(self, prompt, options=None, format=None, on_text=None, prefix=None, cache_if=None) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._answer(prompt, on_text)
+
+    async def generate(self, prompt, options=None, timeout=None, format=None, on_text=None, prefix=None,
+                       cache_if=None) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._answer(prompt, on_text)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_local_model(model_name, threads):
+    """(tokenizer, model) for model_name, loaded once per process."""
+    try:
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+    except ImportError as e:
+        raise RuntimeError("LLM_BACKEND=local needs transformers and torch: "
+                           "pip install transformers torch") from e
+    torch.set_num_threads(threads)
+    log(f"Loading local model {model_name} on CPU ({threads} threads)")
+    tokenizer = AutoTokenizer.from_pretrained(model_name, padding_side="left")
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+    model.eval()
+    return tokenizer, model
+
+
+class LocalModelBackend:
+    """
+    A small causal LM run in this process on the CPU. Requests arriving within
+    LOCAL_BATCH_WAIT_MS of each other are padded into one generate() call of up to
+    LOCAL_BATCH_SIZE prompts. There is no constrained decoding, so format is ignored
+    and the prompt's own JSON instructions are relied on. Responses are cached like
+    the Ollama client's. A request that runs alone reuses the KV cache of its prompt
+    prefix (computed once per prefix), so only its suffix is prefilled; padded
+    batches cannot share it and are prefilled in full.
+    """
+
+    name = "local"
+    structured_format = None
+
+    def __init__(self, model=LOCAL_MODEL, batch_size=LOCAL_BATCH_SIZE, batch_wait_ms=LOCAL_BATCH_WAIT_MS,
+                 threads=LOCAL_THREADS, timeout=None, use_cache=True, **_):
+        self.model = model
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.threads = threads
+        self.timeout = timeout
+        self.cache = default_cache() if use_cache else None
+        self.calls = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._worker = None
+        self._prefix_caches = {}  # templated prefix text -> (token ids, KV cache)
+
+    async def __aenter__(self):
+        await asyncio.get_running_loop().run_in_executor(None, _load_local_model, self.model, self.threads)
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._drain())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        return False
+
+    def _template(self, tokenizer, prompt):
+        return tokenizer.apply_chat_template([{"role": "user", "content": prompt}], tokenize=False,
+                                             add_generation_prompt=True)
+
+    def _run(self, prompts, max_new_tokens):
+        import torch
+
+        tokenizer, model = _load_local_model(self.model, self.threads)
+        texts = [self._template(tokenizer, p) for p in prompts]
+        with self._lock, tracing.span("llm.local_batch", model=self.model, size=len(prompts)):
+            self.calls += len(prompts)
+            self.batches += 1
+            tracing.incr("llm.calls", len(prompts))
+            inputs = tokenizer(texts, return_tensors="pt", padding=True, add_special_tokens=False)
+            with torch.inference_mode():
+                output = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                        pad_token_id=tokenizer.pad_token_id)
+        generated = output[:, inputs["input_ids"].shape[1]:]
+        return [text.strip() for text in tokenizer.batch_decode(generated, skip_special_tokens=True)]
+
+    def _run_prefixed(self, prompt, prefix, max_new_tokens):
+        """Generate for one prompt, reusing the KV cache of its prefix when it aligns with the tokens."""
+        import torch
+
+        tokenizer, model = _load_local_model(self.model, self.threads)
+        text = self._template(tokenizer, prompt)
+        end = text.find(prefix) if prefix else -1
+        if end < 0:
+            return self._run([prompt], max_new_tokens)[0]
+        prefix_text = text[:end + len(prefix)]
+        input_ids = tokenizer(text, return_tensors="pt", add_special_tokens=False)["input_ids"]
+        with self._lock:
+            if prefix_text not in self._prefix_caches:
+                ids = tokenizer(prefix_text, return_tensors="pt", add_special_tokens=False)["input_ids"]
+                with tracing.span("llm.prime", model=self.model, prompt_tokens=ids.shape[1]), torch.inference_mode():
+                    cache = model(ids, use_cache=True).past_key_values
+                if len(self._prefix_caches) >= LOCAL_PREFIX_CACHES:
+                    self._prefix_caches.pop(next(iter(self._prefix_caches)))
+                self._prefix_caches[prefix_text] = (ids, cache)
+                tracing.incr("llm.prefix_primes")
+            prefix_ids, cache = self._prefix_caches[prefix_text]
+        n = prefix_ids.shape[1]
+        # The prefix must tokenize the same on its own as inside the full prompt
+        if input_ids.shape[1] <= n or not torch.equal(input_ids[0, :n], prefix_ids[0]):
+            tracing.incr("llm.prefix_misses")
+            return self._run([prompt], max_new_tokens)[0]
+        tracing.incr("llm.prefix_hits")
+        with self._lock, tracing.span("llm.local_batch", model=self.model, size=1, cached_tokens=n):
+            self.calls += 1
+            self.batches += 1
+            tracing.incr("llm.calls")
+            with torch.inference_mode():
+                output = model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                                        past_key_values=copy.deepcopy(cache), max_new_tokens=max_new_tokens,
+                                        do_sample=False, pad_token_id=tokenizer.pad_token_id)
+        return tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True).strip()
+
+    @staticmethod
+    def _max_new_tokens(options):
+        return int((options or {}).get("num_predict", LOCAL_MAX_NEW_TOKENS))
+
+    def _cached(self, prompt, options):
+        if self.cache is None:
+            return None
+        cached = self.cache.get(prompt, self.model, options)
+        if cached is not None:
+            debug(f"Local model response served from cache (truncated): {cached[:100]}...")
+            tracing.incr("llm.cache_hits")
+        return cached
+
+    def complete(self, prompt, options=None, format=None, on_text=None, prefix=None, cache_if=None) -> str:
+        result = self._cached(prompt, options)
+        if result is None:
+            try:
+                result = self._run_prefixed(prompt, prefix, self._max_new_tokens(options))
+            except Exception as e:
+                log(f"Local model call failed: {e}")
+                return ""
+            if self.cache is not None and (cache_if is None or cache_if(result)):
+                self.cache.put(prompt, self.model, result, options)
+        if on_text is not None and result:
+            on_text(result)
+        return result
+
+    async def generate(self, prompt, options=None, timeout=None, format=None, on_text=None, prefix=None,
+                       cache_if=None) -> str:
+        result = self._cached(prompt, options)
+        if result is None:
+            future = asyncio.get_running_loop().create_future()
+            self._queue.put_nowait((prompt, options, prefix, future))
+            timeout = timeout or self.timeout
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                log(f"Local model call timed out after {timeout:g} seconds!")
+                return ""
+            if not result:
+                return ""
+            if self.cache is not None and (cache_if is None or cache_if(result)):
+                self.cache.put(prompt, self.model, result, options)
+        if on_text is not None:
+            on_text(result)
+        return result
+
+    async def _drain(self):
+        """Collect queued requests into batches and run them one batch at a time."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), max(0.0, deadline - loop.time())))
+                except asyncio.TimeoutError:
+                    break
+            prompts = [prompt for prompt, _, _, _ in batch]
+            max_new_tokens = max(self._max_new_tokens(options) for _, options, _, _ in batch)
+            try:
+                if len(batch) == 1:
+                    results = [await loop.run_in_executor(None, self._run_prefixed, prompts[0], batch[0][2],
+                                                          max_new_tokens)]
+                else:
+                    results = await loop.run_in_executor(None, self._run, prompts, max_new_tokens)
+            except Exception as e:
+                log(f"Local model batch of {len(batch)} failed: {e}")
+                results = [""] * len(batch)
+            for (_, _, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+BACKENDS = {"ollama": AsyncOllamaClient, "local": LocalModelBackend, "stub": StubBackend}
+
+
+def create_backend(name=None, max_in_flight=OLLAMA_MAX_IN_FLIGHT, timeout=OLLAMA_TIMEOUT, **kwargs):
+    """A new, not yet entered, backend of the given kind (LLM_BACKEND by default)."""
+    name = name or LLM_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM_BACKEND {name!r}; expected one of {', '.join(BACKENDS)}")
+    if name == "ollama":
+        return AsyncOllamaClient(max_in_flight=max_in_flight, timeout=timeout, **kwargs)
+    return BACKENDS[name](timeout=timeout, **kwargs)
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def default_backend():
+    """Process-wide in-process backend for synchronous calls (local or stub), created on first use."""
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            _default_backend = create_backend()
+        return _default_backend
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+On-disk memoization of LLM responses.
+
+Responses are keyed on the normalized prompt (whitespace collapsed), the model
+name and the generation options. Entries expire after a TTL and the least
+recently used ones are evicted beyond a maximum entry count. Set
+LLM_CACHE_BYPASS=1 (or pass bypass=True) to always go to the model.
+
+Usage:
+    python llm_cache.py stats
+    python llm_cache.py clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+LLM_CACHE_PATH = os.environ.get(
+    "LLM_CACHE_PATH", str(Path(__file__).parent / ".cache" / "llm_cache.sqlite")
+)
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_TTL_HOURS = float(os.environ.get("LLM_CACHE_TTL_HOURS", "168"))
+LLM_CACHE_BYPASS = os.environ.get("LLM_CACHE_BYPASS", "") not in ("", "0", "false", "False")
+
+
+def normalize_prompt(prompt: str) -> str:
+    return re.sub(r'\s+', ' ', prompt.strip())
+
+
+def cache_key(prompt: str, model: str, options=None) -> str:
+    payload = json.dumps(
+        {"prompt": normalize_prompt(prompt), "model": model, "options": options or {}},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed LRU/TTL store of model responses, safe to share across threads."""
+
+    def __init__(self, path=LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES,
+                 ttl_hours=LLM_CACHE_TTL_HOURS, bypass=LLM_CACHE_BYPASS):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_hours * 3600
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, created REAL, last_used REAL, response TEXT)"
+        )
+        self._conn.commit()
+
+    def get(self, prompt, model, options=None):
+        """Cached response, or None on a miss (always None when bypassed)."""
+        if self.bypass:
+            return None
+        key = cache_key(prompt, model, options)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return row[0]
+
+    def put(self, prompt, model, response, options=None):
+        if self.bypass or not response:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, created, last_used, response) VALUES (?, ?, ?, ?, ?)",
+                (cache_key(prompt, model, options), model, now, now, response)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+        return cur.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"entries": count, "hits": self.hits, "misses": self.misses,
+                "bypass": self.bypass, "path": str(self.path)}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache() -> ResponseCache:
+    """Process-wide ResponseCache, created on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the LLM response cache.")
+    parser.add_argument("command", choices=["stats", "clear"])
+    args = parser.parse_args()
+
+    cache = ResponseCache()
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+    else:
+        print(f"Removed {cache.clear()} entries.")
+
+
+if __name__ == "__main__":
+    main()
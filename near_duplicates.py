@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate section detection with MinHash and locality-sensitive hashing.
+
+Collections often repeat boilerplate: the same heading and near-identical body
+in several volumes of a manual. Each section (heading plus body) is reduced to
+its set of word shingles and a MinHash signature of NEAR_DUP_PERMUTATIONS
+values, whose agreement estimates the Jaccard similarity of two sets. The
+signatures are cut into bands; sections sharing any band become candidate
+pairs, and a pair is a near duplicate when its estimated similarity reaches
+NEAR_DUP_THRESHOLD. Near-duplicate pairs are merged into clusters, and each
+cluster is represented by its first (best-ranked) section.
+
+Sections with fewer than NEAR_DUP_MIN_TOKENS tokens are never merged: a bare
+heading says too little about what follows it.
+"""
+
+import hashlib
+import os
+import random
+
+from retrieval import section_document, tokenize
+
+NEAR_DUP_THRESHOLD = float(os.environ.get("NEAR_DUP_THRESHOLD", "0.8"))
+# "fanout": summarize a cluster once and copy the summary to every occurrence;
+# "collapse": keep only the representative in the output; "off": no detection
+NEAR_DUP_MODE = os.environ.get("NEAR_DUP_MODE", "fanout")
+NEAR_DUP_PERMUTATIONS = 64
+NEAR_DUP_BANDS = 16
+NEAR_DUP_SHINGLE = 3
+NEAR_DUP_MIN_TOKENS = 8
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 64) - 1
+
+
+class MinHasher:
+    """MinHash signatures from a fixed family of random linear hash functions."""
+
+    def __init__(self, permutations=NEAR_DUP_PERMUTATIONS, seed=1):
+        rng = random.Random(seed)
+        self.params = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(permutations)]
+
+    def signature(self, shingles):
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+                  for s in shingles]
+        if not hashes:
+            return [_MAX_HASH] * len(self.params)
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self.params]
+
+
+def shingles(text, size=NEAR_DUP_SHINGLE):
+    """The set of size-word shingles of text (the whole text when it is shorter)."""
+    tokens = tokenize(text)
+    if len(tokens) <= size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def similarity(signature_a, signature_b) -> float:
+    """Estimated Jaccard similarity of the sets behind two signatures."""
+    return sum(a == b for a, b in zip(signature_a, signature_b)) / len(signature_a)
+
+
+def near_duplicate_clusters(sections, threshold=NEAR_DUP_THRESHOLD, hasher=None):
+    """
+    Clusters of near-duplicate sections, as lists of indexes into sections in
+    ascending order; sections without a near duplicate are not listed.
+    """
+    hasher = hasher or MinHasher()
+    rows = len(hasher.params) // NEAR_DUP_BANDS
+    signatures = {}
+    for i, section in enumerate(sections):
+        text = section_document(section)
+        if len(tokenize(text)) >= NEAR_DUP_MIN_TOKENS:
+            signatures[i] = hasher.signature(shingles(text))
+
+    buckets = {}
+    for i, signature in signatures.items():
+        for band in range(NEAR_DUP_BANDS):
+            key = (band, tuple(signature[band * rows:(band + 1) * rows]))
+            buckets.setdefault(key, []).append(i)
+
+    parent = {i: i for i in signatures}
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    checked = set()
+    for members in buckets.values():
+        for x, i in enumerate(members):
+            for j in members[x + 1:]:
+                if (i, j) in checked:
+                    continue
+                checked.add((i, j))
+                if similarity(signatures[i], signatures[j]) >= threshold:
+                    root_i, root_j = find(i), find(j)
+                    if root_i != root_j:
+                        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters = {}
+    for i in signatures:
+        clusters.setdefault(find(i), []).append(i)
+    return [sorted(members) for members in clusters.values() if len(members) > 1]
+
+
+def deduplicate(sections, threshold=NEAR_DUP_THRESHOLD):
+    """
+    (unique sections, [(duplicate, representative), ...]). Order is kept, and the
+    representative of a cluster is its first section, so with sections sorted
+    best rank first it is the best-ranked occurrence.
+    """
+    duplicates = []
+    dropped = set()
+    for cluster in near_duplicate_clusters(sections, threshold):
+        representative = sections[cluster[0]]
+        for i in cluster[1:]:
+            duplicates.append((sections[i], representative))
+            dropped.add(i)
+    unique = [section for i, section in enumerate(sections) if i not in dropped]
+    return unique, duplicates
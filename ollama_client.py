@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Asynchronous Ollama client.
+
+One aiohttp session per client keeps connections to the server alive between
+calls; a semaphore bounds how many generations are in flight at once and each
+request has its own timeout. Responses go through the same on-disk cache as
+the synchronous call_ollama.
+
+Structured output: with OLLAMA_FORMAT=auto (the default) the server version is
+checked once; servers from 0.5.0 on are asked for output matching a JSON
+schema, older ones for plain JSON. OLLAMA_FORMAT=schema|json|none forces a mode.
+Streamed text can be handed to a callback chunk by chunk as it arrives.
+
+Prompt prefix reuse: every request asks the server to keep the model loaded
+for OLLAMA_KEEP_ALIVE, so its KV cache survives between calls and runs. Batch
+prompts start with a byte-identical persona/job preamble and are all sent with
+the same options (num_ctx included, since a change reloads the runner), so the
+server's own prompt cache finds the preamble already evaluated and only
+prefills the per-section suffix. Prompts are sent whole, through the model's
+chat template, exactly as without reuse. With several endpoints, the preamble
+(generate's prefix) is the call's affinity key in the EndpointPool, so calls
+sharing it keep going to a server whose cache already holds it.
+
+Several servers: OLLAMA_URLS (comma-separated generate URLs; default OLLAMA_URL
+alone) spreads calls over all of them through an EndpointPool. Each call goes
+to the least-loaded endpoint that is up. A call that fails before any text
+streamed in is retried on the next endpoint, within the call's timeout.
+Endpoints are health-checked every OLLAMA_HEALTH_INTERVAL seconds and are
+taken out of rotation by a circuit breaker. OLLAMA_MAX_IN_FLIGHT applies per
+endpoint, and per-endpoint throughput is logged when the client closes.
+"""
+
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+
+import aiohttp
+
+import tracing
+from endpoint_pool import EndpointPool
+from llm_cache import default_cache
+from response_parser import ITEMS_SCHEMA
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
+OLLAMA_URLS = [u.strip() for u in os.environ.get("OLLAMA_URLS", OLLAMA_URL).split(",") if u.strip()]
+OLLAMA_MODEL = "gemma3:1b"
+OLLAMA_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "60"))
+OLLAMA_MAX_IN_FLIGHT = int(os.environ.get("OLLAMA_MAX_IN_FLIGHT", "4"))  # per endpoint
+OLLAMA_HEALTH_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "10"))
+OLLAMA_FORMAT = os.environ.get("OLLAMA_FORMAT", "auto")
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")  # "" leaves the server default
+LOG_VERBOSE = os.environ.get("LOG_VERBOSE", "") not in ("", "0", "false", "False")
+
+
+def log(msg):
+    print(f"[{datetime.now().isoformat()}] {msg}")
+
+
+def debug(msg):
+    """log() for per-call detail such as prompts and responses; silent unless LOG_VERBOSE=1."""
+    if LOG_VERBOSE:
+        log(msg)
+
+
+def version_url(url=OLLAMA_URL) -> str:
+    return url.rsplit("/api/", 1)[0] + "/api/version"
+
+
+def structured_format(version, setting=OLLAMA_FORMAT):
+    """
+    The "format" value to request for the setting and the server version string
+    (None when the version is unknown): the item schema, "json", or None for free text.
+    """
+    if setting == "schema":
+        return ITEMS_SCHEMA
+    if setting == "json":
+        return "json"
+    if setting != "auto" or not version:
+        return None
+    try:
+        parts = tuple(int(p) for p in version.split("-")[0].split(".")[:2])
+    except ValueError:
+        return "json"
+    return ITEMS_SCHEMA if parts >= (0, 5) else "json"
+
+
+def cache_options(options, fmt):
+    """Generation options as used for the response-cache key (format included)."""
+    if fmt is None:
+        return options
+    return dict(options or {}, format=fmt)
+
+
+def generate_payload(model, prompt, options=None, format=None) -> dict:
+    """Body of an /api/generate request."""
+    payload = {"model": model, "prompt": prompt}
+    if options:
+        payload["options"] = options
+    if format is not None:
+        payload["format"] = format
+    if OLLAMA_KEEP_ALIVE:
+        payload["keep_alive"] = OLLAMA_KEEP_ALIVE
+    return payload
+
+
+def common_format(versions, setting=OLLAMA_FORMAT):
+    """The structured_format every server supports, given their version strings (None: unknown)."""
+    formats = [structured_format(version, setting) for version in versions if version]
+    if not formats:
+        return structured_format(None, setting)
+    return "json" if "json" in formats else formats[0]
+
+
+class AsyncOllamaClient:
+    """
+    Usage:
+        async with AsyncOllamaClient() as client:
+            texts = await asyncio.gather(*(client.generate(p) for p in prompts))
+    """
+
+    name = "ollama"
+
+    def __init__(self, urls=None, model=OLLAMA_MODEL, max_in_flight=OLLAMA_MAX_IN_FLIGHT,
+                 timeout=OLLAMA_TIMEOUT, use_cache=True, health_interval=OLLAMA_HEALTH_INTERVAL):
+        self.pool = EndpointPool(urls or OLLAMA_URLS)
+        self.model = model
+        self.per_endpoint = max_in_flight
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.cache = default_cache() if use_cache else None
+        self.calls = 0
+        self.structured_format = None
+        self._session = None
+        self._slots = {}  # endpoint URL -> semaphore of its max_in_flight slots
+        self._health_task = None
+
+    async def __aenter__(self):
+        # Pool size matches the in-flight limits so every slot reuses a kept-alive connection
+        connector = aiohttp.TCPConnector(limit=self.per_endpoint * len(self.pool), limit_per_host=self.per_endpoint,
+                                         keepalive_timeout=60)
+        self._session = aiohttp.ClientSession(connector=connector)
+        self._slots = {endpoint.url: asyncio.Semaphore(self.per_endpoint) for endpoint in self.pool.endpoints}
+        versions = await asyncio.gather(*(self._check(endpoint) for endpoint in self.pool.endpoints))
+        if OLLAMA_FORMAT == "auto" and not any(versions):
+            log("Could not read the Ollama version; requesting free-text output")
+        self.structured_format = common_format(versions)
+        if len(self.pool) > 1 and self.health_interval > 0:
+            self._health_task = asyncio.ensure_future(self._health_loop())
+        return self
+
+    @property
+    def max_in_flight(self) -> int:
+        """Calls that can run at once: max_in_flight per endpoint taking traffic."""
+        return self.per_endpoint * max(1, self.pool.available())
+
+    async def _check(self, endpoint):
+        """Health-check endpoint through /api/version; its version string, or None when it is down."""
+        try:
+            async with self._session.get(version_url(endpoint.url),
+                                         timeout=aiohttp.ClientTimeout(total=5)) as response:
+                response.raise_for_status()
+                version = (await response.json(content_type=None)).get("version")
+        except Exception as e:
+            if self.pool.checked(endpoint, False) and len(self.pool) > 1:
+                log(f"Ollama endpoint {endpoint.url} failed its health check ({e}); out of rotation")
+            return None
+        if self.pool.checked(endpoint, True):
+            log(f"Ollama endpoint {endpoint.url} is healthy again")
+        return version or None
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(*(self._check(endpoint) for endpoint in self.pool.endpoints))
+
+    async def __aexit__(self, *exc):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        await self._session.close()
+        self._session = None
+        if len(self.pool) > 1:
+            log(f"Ollama endpoints:\n{self.pool.summary()}")
+
+    async def generate(self, prompt, options=None, timeout=None, format=None, on_text=None, prefix=None,
+                       cache_if=None) -> str:
+        """
+        Completion text for prompt; "" on timeout or error, like call_ollama.
+        format is passed through as Ollama's "format" (JSON mode or a JSON schema);
+        on_text, if given, receives each streamed piece of text as it arrives.
+        prefix, the fixed start of prompt shared by many calls, routes the call to an
+        endpoint that already evaluated it, so the server's prompt cache reuses it (see
+        the module docstring).
+        cache_if, if given, is called with the response, which is only cached when it returns True.
+        """
+        key_options = cache_options(options, format)
+        if self.cache is not None:
+            cached = self.cache.get(prompt, self.model, key_options)
+            if cached is not None:
+                debug(f"Ollama response served from cache (truncated): {cached[:100]}...")
+                tracing.incr("llm.cache_hits")
+                return cached
+        result = await self._post(prompt, options, timeout or self.timeout, format, on_text, prefix)
+        if self.cache is not None and (cache_if is None or cache_if(result)):
+            self.cache.put(prompt, self.model, result, key_options)
+        return result
+
+    def _attempt_failed(self, endpoint, error, seconds):
+        """Record a failed request to endpoint with the pool."""
+        if isinstance(error, asyncio.TimeoutError):
+            tracing.incr("llm.timeouts")
+            self.pool.timed_out(endpoint, seconds)
+            return
+        tracing.incr("llm.errors")
+        if self.pool.failed(endpoint, seconds) and len(self.pool) > 1:
+            log(f"Ollama endpoint {endpoint.url} keeps failing; out of rotation")
+
+    async def _post(self, prompt, options, timeout, format=None, on_text=None, prefix=None):
+        """
+        Stream one completion from the least-loaded endpoint, waiting for one of its
+        max_in_flight slots. A request that fails before any text arrived is retried
+        on the next endpoint while time is left.
+        """
+        debug(f"Calling Ollama with prompt (truncated): {prompt[:100]}...")
+        payload = generate_payload(self.model, prompt, options, format)
+        self.calls += 1
+        tracing.incr("llm.calls")
+        started = time.perf_counter()
+        tried = []
+        while len(tried) < len(self.pool):
+            remaining = timeout - (time.perf_counter() - started)
+            if remaining <= 0:
+                break
+            if tried:
+                tracing.incr("llm.failovers")
+            endpoint = self.pool.acquire(tried, affinity=prefix)
+            tried.append(endpoint)
+            recorded = False
+            try:
+                async with self._slots[endpoint.url]:
+                    attempt_started = time.perf_counter()
+                    remaining = timeout - (attempt_started - started)
+                    result = ""
+                    output_tokens = 0
+                    try:
+                        with tracing.span("llm.http", model=self.model, endpoint=endpoint.url) as stage:
+                            async with self._session.post(
+                                endpoint.url, json=payload, timeout=aiohttp.ClientTimeout(total=max(remaining, 0.001))
+                            ) as response:
+                                response.raise_for_status()
+                                async for line in response.content:
+                                    line = line.strip()
+                                    if not line:
+                                        continue
+                                    try:
+                                        chunk = json.loads(line.decode("utf-8"))
+                                    except Exception:
+                                        continue
+                                    if chunk.get("response"):
+                                        if not result:
+                                            tracing.record("llm.first_token", time.perf_counter() - started)
+                                        result += chunk["response"]
+                                        if on_text is not None:
+                                            on_text(chunk["response"])
+                                    if chunk.get("done"):
+                                        output_tokens = chunk.get("eval_count") or 0
+                                        stage.set(prompt_tokens=chunk.get("prompt_eval_count"),
+                                                  output_tokens=chunk.get("eval_count"))
+                                        tracing.incr("llm.prompt_tokens", chunk.get("prompt_eval_count") or 0)
+                    except asyncio.TimeoutError as e:
+                        recorded = True
+                        self._attempt_failed(endpoint, e, time.perf_counter() - attempt_started)
+                        log(f"Ollama call timed out after {timeout:g} seconds!")
+                        return ""
+                    except Exception as e:
+                        recorded = True
+                        self._attempt_failed(endpoint, e, time.perf_counter() - attempt_started)
+                        log(f"Ollama call failed: {e}" + (f" ({endpoint.url})" if len(self.pool) > 1 else ""))
+                        if result:
+                            # Text already went to on_text; a retry elsewhere would repeat it
+                            return ""
+                        continue
+                    recorded = True
+                    self.pool.succeeded(endpoint, time.perf_counter() - attempt_started, output_tokens)
+            finally:
+                if not recorded:
+                    # Cancelled (e.g. by a deadline): neither a success nor a failure of the endpoint
+                    self.pool.cancelled(endpoint)
+            debug(f"Ollama response received (truncated): {result[:100]}...")
+            return result.strip()
+        return ""
@@ -5,47 +5,147 @@ from pathlib import Path
 from datetime import datetime
 import sys
 import time
-import concurrent.futures
-
-# from sympy import per
-
-def log(msg):
-    print(f"[{datetime.now().isoformat()}] {msg}")
+import asyncio
 
 # Ensure parent directory is in sys.path for import
 sys.path.append(str(Path(__file__).parent.parent))
-from process_pdfs import extract_outline_tree, flatten_outline
-
-OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
-OLLAMA_MODEL = "gemma3:1b"
-
-def call_ollama(prompt, model=OLLAMA_MODEL):
-    log(f"Calling Ollama with prompt (truncated): {prompt[:100]}...")
-    try:
-        response = requests.post(
-            OLLAMA_URL,
-            json={"model": model, "prompt": prompt},
-            stream=True,
-            timeout=60
-        )
-        response.raise_for_status()
+import tracing
+from process_pdfs import flatten_outline
+from section_text import estimate_tokens, truncate_to_tokens
+from parse_cache import ParseCache, load_parsed, section_body
+from llm_cache import default_cache
+from ollama_client import (OLLAMA_URLS, OLLAMA_MODEL, OLLAMA_MAX_IN_FLIGHT, OLLAMA_FORMAT, cache_options,
+                           common_format, generate_payload, version_url, log, debug)
+from endpoint_pool import EndpointPool
+from response_parser import StreamingItemParser
+from llm_backend import LLM_BACKEND, create_backend, default_backend
+from extractive import extractive_summary
+from retrieval import SectionIndex, build_query, EMBED_MODEL, RETRIEVAL_TOP_K, INDEX_TOKEN_BUDGET, EXCERPT_TOKEN_BUDGET
+from collection_index import CollectionIndex
+from extraction_pool import ExtractionPool, EXTRACT_WORKERS
+from process_pdfs import pdf_page_count
+from near_duplicates import NEAR_DUP_MODE, deduplicate
+from deadline import (RUN_DEADLINE, client_parallelism, default_costs, fit_llm_sections, parse_reserve,
+                      start_deadline)
+from run_journal import RunJournal, batch_key, journal_path
+from batch_planner import plan_batches, split_batch, generation_options
+
+# Sections up to this collection rank are summarized by the model, the rest extractively
+# (negative: every section goes to the model). Bounds the model calls per collection.
+LLM_SECTIONS = int(os.environ.get("LLM_SECTIONS", "5"))
+
+def call_ollama(prompt, model=OLLAMA_MODEL, options=None, use_cache=True, format=None, on_text=None, prefix=None,
+                cache_if=None):
+    """
+    Generate a completion, answering from the on-disk response cache when the same
+    prompt, model, options and format were seen before. use_cache=False (or
+    LLM_CACHE_BYPASS=1) always calls the server. format is Ollama's structured-output
+    option; on_text receives each streamed piece of text. prefix, the fixed start of
+    prompt, sends the call to an endpoint whose prompt cache holds it (see ollama_client). cache_if, if
+    given, decides from the response whether it is cached.
+    """
+    cache = default_cache() if use_cache else None
+    key_options = cache_options(options, format)
+    if cache is not None:
+        cached = cache.get(prompt, model, key_options)
+        if cached is not None:
+            debug(f"Ollama response served from cache (truncated): {cached[:100]}...")
+            tracing.incr("llm.cache_hits")
+            return cached
+    result = _post_ollama(prompt, model, options, format, on_text, prefix)
+    if cache is not None and (cache_if is None or cache_if(result)):
+        cache.put(prompt, model, result, key_options)
+    return result
+
+# Endpoint state of the synchronous calls (the async client keeps its own)
+endpoints = EndpointPool(OLLAMA_URLS)
+
+def _post_ollama(prompt, model, options=None, format=None, on_text=None, prefix=None):
+    """
+    Stream one completion from the least-loaded endpoint, failing over to the next
+    one when a request fails before any text arrived.
+    """
+    debug(f"Calling Ollama with prompt (truncated): {prompt[:100]}...")
+    payload = generate_payload(model, prompt, options, format)
+    tracing.incr("llm.calls")
+    started = time.perf_counter()
+    tried = []
+    while len(tried) < len(endpoints):
+        if tried:
+            tracing.incr("llm.failovers")
+        endpoint = endpoints.acquire(tried, affinity=prefix)
+        tried.append(endpoint)
+        attempt_started = time.perf_counter()
         result = ""
-        for line in response.iter_lines():
-            if line:
-                try:
-                    chunk = json.loads(line.decode("utf-8"))
-                    if "response" in chunk:
-                        result += chunk["response"]
-                except Exception:
-                    continue
-        log(f"Ollama response received (truncated): {result[:100]}...")
+        output_tokens = 0
+        try:
+            with tracing.span("llm.http", model=model, endpoint=endpoint.url):
+                response = requests.post(
+                    endpoint.url,
+                    json=payload,
+                    stream=True,
+                    timeout=60
+                )
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line:
+                        try:
+                            chunk = json.loads(line.decode("utf-8"))
+                            if "response" in chunk:
+                                if chunk["response"] and not result:
+                                    tracing.record("llm.first_token", time.perf_counter() - started)
+                                result += chunk["response"]
+                                if on_text is not None and chunk["response"]:
+                                    on_text(chunk["response"])
+                            if chunk.get("done"):
+                                output_tokens = chunk.get("eval_count") or 0
+                        except Exception:
+                            continue
+        except requests.Timeout:
+            tracing.incr("llm.timeouts")
+            endpoints.timed_out(endpoint, time.perf_counter() - attempt_started)
+            log("Ollama call timed out after 60 seconds!")
+            return ""
+        except Exception as e:
+            tracing.incr("llm.errors")
+            if endpoints.failed(endpoint, time.perf_counter() - attempt_started) and len(endpoints) > 1:
+                log(f"Ollama endpoint {endpoint.url} keeps failing; out of rotation")
+            log(f"Ollama call failed: {e}")
+            if result:
+                # Text already went to on_text; a retry elsewhere would repeat it
+                return ""
+            continue
+        endpoints.succeeded(endpoint, time.perf_counter() - attempt_started, output_tokens)
+        debug(f"Ollama response received (truncated): {result[:100]}...")
         return result.strip()
-    except requests.Timeout:
-        log("Ollama call timed out after 60 seconds!")
-        return ""
-    except Exception as e:
-        log(f"Ollama call failed: {e}")
-        return ""
+    return ""
+
+def complete(prompt, options=None, format=None, on_text=None, prefix=None, cache_if=None):
+    """Synchronous completion through the configured LLM_BACKEND."""
+    if LLM_BACKEND == "ollama":
+        return call_ollama(prompt, options=options, format=format, on_text=on_text, prefix=prefix, cache_if=cache_if)
+    return default_backend().complete(prompt, options, format, on_text, prefix=prefix, cache_if=cache_if)
+
+_server_format = {}
+
+def batch_format():
+    """The structured-output format for batch prompts, checking the server version once."""
+    if LLM_BACKEND != "ollama":
+        return None
+    if "format" not in _server_format:
+        versions = []
+        if OLLAMA_FORMAT == "auto":
+            for endpoint in endpoints.endpoints:
+                try:
+                    response = requests.get(version_url(endpoint.url), timeout=5)
+                    response.raise_for_status()
+                    versions.append(response.json().get("version"))
+                except Exception as e:
+                    log(f"Could not read Ollama version of {endpoint.url} ({e})")
+            if not any(versions):
+                log("Requesting free-text output")
+        _server_format["format"] = common_format(versions)
+    return _server_format["format"]
 
 def get_refined_text(section_text, persona, job_to_be_done):
     log(f"Refining section for persona '{persona}' and job '{job_to_be_done}'")
@@ -54,7 +154,7 @@ def get_refined_text(section_text, persona, job_to_be_done):
         f"Given the following extracted section {section_text} from a PDF, provide a concise, actionable summary tailored to this persona and job.\n\n"
         f"just return the refined text, no other text.\n\n"
     )
-    return call_ollama(prompt)
+    return complete(prompt)
 
 def select_relevant_documents(input_documents, persona, job_to_be_done):
     # Only keep documents whose filename contains a word from the job description
@@ -67,106 +167,375 @@ def select_relevant_documents(input_documents, persona, job_to_be_done):
             relevant.append(doc)
     return relevant
 
-def select_relevant_sections(flat_outline, persona, job_to_be_done):
-    # For robustness, just use all sections (let the LLM decide relevance in the summary step)
-    return flat_outline
+def select_relevant_sections(flat_outline, persona, job_to_be_done, top_k=RETRIEVAL_TOP_K, index=None):
+    """
+    Rank sections against the persona and job with the retrieval index and keep the top_k.
+    Each kept section gets its 1-based "rank" and its "score". Pass a prebuilt
+    SectionIndex over flat_outline (or a CollectionIndex view) as index to skip indexing.
+    """
+    if index is None:
+        index = SectionIndex(flat_outline)
+    hits = index.search(build_query(persona, job_to_be_done), top_k)
+    log(f"Ranked {len(index)} sections with {index.kind}; keeping top {len(hits)}")
+    ranked = []
+    for rank, (score, section) in enumerate(hits, start=1):
+        ranked.append(dict(section, rank=rank, score=score))
+    return ranked
 
-def process_pdf(pdf_name, pdf_dir, persona, job_to_be_done, delay):
+def process_pdf(pdf_name, pdf_dir, persona, job_to_be_done, delay, parse_cache=None):
     log(f"Processing PDF: {pdf_name}")
     pdf_path = Path(pdf_dir) / pdf_name
-    outline = extract_outline_tree(pdf_path, Path(pdf_dir))
-    flat_outline = flatten_outline(outline)
+    parsed = load_parsed(pdf_path, parse_cache)
+    flat_outline = flatten_outline(parsed["tree"], with_position=True)
     main_sections = [s for s in flat_outline if s.get("level") in ("H1", "H2", "H3", "H4")]
     if not main_sections:
         log(f"No main sections found in {pdf_name}, skipping.")
         return [], []
-    # Extract the full text (or first N pages for context)
-    try:
-        import fitz
-        doc = fitz.open(pdf_path)
-        pdf_text = "\n".join(page.get_text() for page in doc)
-    except Exception:
-        pdf_text = ""
-    result = analyze_pdf_with_llm(pdf_name, main_sections, persona, job_to_be_done, pdf_text)
+    for section in main_sections:
+        section["excerpt"] = section_body(parsed, section, token_budget=EXCERPT_TOKEN_BUDGET)
+    result = analyze_pdf_with_llm(pdf_name, main_sections, persona, job_to_be_done, "")
     time.sleep(delay)
     return result.get("extracted_sections", []), result.get("subsection_analysis", [])
 
-def analyze_collection_with_ollama(input_json_path, pdf_dir, output_json_path, delay=2, max_workers=4):
-    log(f"Loading input from {input_json_path}")
-    with open(input_json_path, encoding="utf-8") as f:
-        input_data = json.load(f)
+def prepare_sections(pdf_name, parsed):
+    """All H1-H4 sections of a parsed document, with body text for indexing and a prompt excerpt."""
+    flat_outline = flatten_outline(parsed["tree"], with_position=True)
+    main_sections = [s for s in flat_outline if s.get("level") in ("H1", "H2", "H3", "H4")]
+    if not main_sections:
+        log(f"No main sections found in {pdf_name}, skipping.")
+    for section in main_sections:
+        section["document"] = pdf_name
+        section["body"] = section_body(parsed, section, token_budget=INDEX_TOKEN_BUDGET)
+        section["excerpt"] = truncate_to_tokens(section["body"], EXCERPT_TOKEN_BUDGET)
+    return main_sections
 
-    persona = input_data.get("persona")
-    if isinstance(persona, dict):
-        persona = persona.get("role", "")
-    job_to_be_done = input_data.get("job_to_be_done")
-    if isinstance(job_to_be_done, dict):
-        job_to_be_done = job_to_be_done.get("task", "")
+class CollectionRun:
+    """
+    One challenge1b_input.json being processed: its inputs, section index and timings.
+    Sections live in the persistent CollectionIndex of the PDF directory; with
+    EMBED_MODEL set they are also embedded into an in-memory SectionIndex.
+    """
 
-    input_documents = [doc.get("filename") for doc in input_data.get("documents", [])]
+    def __init__(self, input_json_path, pdf_dir=None, output_json_path=None, input_data=None, store=None):
+        self.input_json_path = Path(input_json_path)
+        self.pdf_dir = Path(pdf_dir) if pdf_dir else self.input_json_path.parent / "PDFs"
+        self.output_json_path = (Path(output_json_path) if output_json_path
+                                 else self.input_json_path.parent / "challenge1b_output.json")
+        self.name = self.input_json_path.parent.name
 
-    extracted_sections = []
-    subsection_analysis = []
+        if input_data is None:
+            log(f"Loading input from {self.input_json_path}")
+            with open(self.input_json_path, encoding="utf-8") as f:
+                input_data = json.load(f)
+        persona = input_data.get("persona")
+        if isinstance(persona, dict):
+            persona = persona.get("role", "")
+        job_to_be_done = input_data.get("job_to_be_done")
+        if isinstance(job_to_be_done, dict):
+            job_to_be_done = job_to_be_done.get("task", "")
+        self.persona = persona
+        self.job_to_be_done = job_to_be_done
+        self.input_documents = [doc.get("filename") for doc in input_data.get("documents", [])]
+        self.documents = list(dict.fromkeys(self.input_documents))
 
-    log("Selecting relevant documents using job keywords...")
-    relevant_documents = list(dict.fromkeys(select_relevant_documents(input_documents, persona, job_to_be_done)))
-    if not relevant_documents:
-        log("No relevant documents found. Exiting.")
-        output = {
-            "metadata": {
-                "input_documents": input_documents,
-                "persona": persona,
-                "job_to_be_done": job_to_be_done,
-                "processing_timestamp": datetime.now().isoformat()
-            },
-            "extracted_sections": [],
-            "subsection_analysis": []
-        }
-        with open(output_json_path, "w", encoding="utf-8") as f:
-            json.dump(output, f, indent=4, ensure_ascii=False)
-        return
-
-    import math
-    from process_pdfs import extract_outline_tree, flatten_outline
-    def process_and_summarize(pdf_name):
-        log(f"Processing PDF: {pdf_name}")
-        pdf_path = Path(pdf_dir) / pdf_name
-        outline = extract_outline_tree(pdf_path, Path(pdf_dir))
-        flat_outline = flatten_outline(outline)
-        main_sections = [s for s in flat_outline if s.get("level") in ("H1", "H2", "H3", "H4")]
-        if not main_sections:
-            log(f"No main sections found in {pdf_name}, skipping.")
-            return [], []
-        # Keep only top 3 sections
-        main_sections.sort(key=lambda x: x.get('level', ''))
-        main_sections = main_sections[:3]
-        # Extract the full text (or first N pages for context)
-        try:
-            import fitz
-            doc = fitz.open(pdf_path)
-            pdf_text = "\n".join(page.get_text() for page in doc)
-        except Exception:
-            pdf_text = ""
-        # Now send to LLM for summarization (all sections in one call)
-        result = analyze_pdf_with_llm(pdf_name, main_sections, persona, job_to_be_done, pdf_text)
-        return result.get("extracted_sections", []), result.get("subsection_analysis", [])
-
-    # Parallelize PDF processing with max_workers=4
-    extracted_sections = []
-    subsection_analysis = []
-    processed = set()
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        futures = {}
-        for pdf_name in relevant_documents:
-            if pdf_name in processed:
-                continue
-            processed.add(pdf_name)
-            futures[executor.submit(process_and_summarize, pdf_name)] = pdf_name
-        for future in concurrent.futures.as_completed(futures):
-            sections, analysis = future.result()
-            extracted_sections.extend(sections)
-            subsection_analysis.extend(analysis)
+        self.store = store or CollectionIndex(self.pdf_dir)
+        self.embeddings = SectionIndex() if EMBED_MODEL else None
+        self.index = self.embeddings if EMBED_MODEL else self.store.view(self.documents)
+        self.pending = len(self.documents)
+        self.parsed = None  # asyncio.Event, set once every document is indexed
+        self.timings = {}
+
+    def add_document(self, name, sections):
+        """Index a freshly parsed document."""
+        self.store.add_document(name, sections)
+        if self.embeddings is not None:
+            self.embeddings.add(sections)
+
+    @classmethod
+    def from_path(cls, path):
+        """Accepts a collection directory or the path of its challenge1b_input.json."""
+        path = Path(path)
+        return cls(path / "challenge1b_input.json" if path.is_dir() else path)
+
+async def summarize_collection(run, client, top_k=RETRIEVAL_TOP_K, resume=False, llm_sections=LLM_SECTIONS,
+                               on_event=None, deadline=None, near_duplicates=NEAR_DUP_MODE):
+    """
+    Rank a fully indexed collection, summarize its top sections and write its output,
+    which is also returned. on_event, if given, receives the partial results as they
+    are ready: {"event": "ranked", "sections": [...]} and then one
+    {"event": "document", "document": ..., "extracted_sections": [...], ...} per document.
+    Near-duplicate sections are summarized once: with near_duplicates="fanout" the
+    summary is copied to the other occurrences (sent as a final "duplicates" event),
+    with "collapse" they are left out of the output, and "off" summarizes each one.
+    With a Deadline, only as many top sections go to the model as are expected to
+    finish in time, and whatever is unfinished when it expires is summarized
+    extractively, so the output is still written on time.
+    """
+    started = time.perf_counter()
+    log(f"[{run.name}] Ranking sections against persona and job...")
+    with tracing.span("retrieval.rank", collection=run.name):
+        ranked_sections = select_relevant_sections(None, run.persona, run.job_to_be_done, top_k, index=run.index)
+    if on_event is not None:
+        on_event({"event": "ranked", "sections": [
+            {"document": s["document"], "section_title": s.get("text", ""), "page_number": s.get("page", 1),
+             "importance_rank": s["rank"]}
+            for s in ranked_sections
+        ]})
+    if not ranked_sections:
+        log(f"[{run.name}] No relevant sections found.")
+        return write_output(run.output_json_path, run.input_documents, run.persona, run.job_to_be_done, [], [])
+
+    run_info = {"input": str(run.input_json_path), "persona": run.persona, "job_to_be_done": run.job_to_be_done,
+                "top_k": top_k, "llm_sections": llm_sections, "near_duplicates": near_duplicates}
+    sections, duplicates = ranked_sections, []
+    if near_duplicates != "off":
+        with tracing.span("dedup", collection=run.name, sections=len(ranked_sections)):
+            sections, duplicates = deduplicate(ranked_sections)
+    if duplicates:
+        saved = (planned_calls(ranked_sections, llm_sections, run.persona, run.job_to_be_done)
+                 - planned_calls(sections, llm_sections, run.persona, run.job_to_be_done))
+        clusters = len({id(representative) for _, representative in duplicates})
+        log(f"[{run.name}] {len(duplicates)} near-duplicate section(s) in {clusters} cluster(s) summarized once; "
+            f"{saved} model call(s) saved")
+        tracing.incr("dedup.sections", len(duplicates))
+        tracing.incr("dedup.calls_saved", saved)
+        run.timings["calls_saved"] = saved
+    # Documents with sections moved off the model by the deadline are journaled as degraded
+    downgraded = set()
+    if deadline is not None:
+        fitted = fit_llm_sections(sections, llm_sections, deadline, client_parallelism(client))
+        kept = {id(section) for section in route_sections(sections, fitted)[0]}
+        downgraded = {section["document"] for section in route_sections(sections, llm_sections)[0]
+                      if id(section) not in kept}
+        if len(route_sections(sections, fitted)[0]) < len(route_sections(sections, llm_sections)[0]):
+            log(f"[{run.name}] Deadline: {deadline.remaining():.1f}s left, model limited to sections ranked "
+                f"up to {fitted}")
+            tracing.incr("deadline.downgrades")
+            llm_sections = fitted
+    generated = len(route_sections(sections, llm_sections)[0])
+    log(f"[{run.name}] {generated} section(s) to the model, {len(sections) - generated} extractive")
+    by_document = group_by_document(sections)
+
+    # Finished batches and documents are journaled as they complete; --resume skips them
+    with RunJournal(journal_path(run.output_json_path), run_info, resume=resume) as journal:
+        async def summarize_document(pdf_name, sections):
+            if journal.document(pdf_name) is not None:
+                log(f"Resuming: {pdf_name} already done")
+                return
+            result = await analyze_pdf_with_llm_async(pdf_name, sections, run.persona, run.job_to_be_done, "",
+                                                      client, journal=journal, llm_sections=llm_sections,
+                                                      deadline=deadline)
+            journal.record_document(pdf_name, result,
+                                    degraded=result.pop("degraded", False) or pdf_name in downgraded)
+            if on_event is not None:
+                on_event({"event": "document", "document": pdf_name,
+                          "extracted_sections": result.get("extracted_sections", []),
+                          "subsection_analysis": result.get("subsection_analysis", [])})
+
+        work = asyncio.gather(*(summarize_document(name, sections) for name, sections in by_document.items()))
+        if deadline is None:
+            await work
+        else:
+            try:
+                await asyncio.wait_for(work, deadline.remaining())
+            except asyncio.TimeoutError:
+                # Calls still running are cancelled; finished batches come from the journal
+                unfinished = [name for name in by_document if journal.document(name) is None]
+                log(f"[{run.name}] Deadline reached; {len(unfinished)} document(s) finished extractively")
+                tracing.incr("deadline.expired")
+                for name in unfinished:
+                    await summarize_document(name, by_document[name])
+        # Output in retrieval order, best section first
+        extracted_sections, subsection_analysis = journal.assemble()
+    if near_duplicates == "fanout" and duplicates:
+        copies = fan_out_duplicates(duplicates, extracted_sections, subsection_analysis)
+        if on_event is not None and copies:
+            on_event({"event": "duplicates", "extracted_sections": [e for e, _ in copies],
+                      "subsection_analysis": [s for _, s in copies]})
+        pairs = sorted(list(zip(extracted_sections, subsection_analysis)) + copies,
+                       key=lambda p: p[0]["importance_rank"])
+        extracted_sections, subsection_analysis = [p[0] for p in pairs], [p[1] for p in pairs]
+    elif near_duplicates == "collapse":
+        for rank, section in enumerate(extracted_sections, start=1):
+            section["importance_rank"] = rank
+    output = write_output(run.output_json_path, run.input_documents, run.persona, run.job_to_be_done,
+                          extracted_sections, subsection_analysis)
+    run.timings["summarize"] = time.perf_counter() - started
+    run.timings["sections"] = len(ranked_sections)
+    return output
+
+def group_by_document(sections):
+    """{document: [its sections, in order]}, documents in order of first appearance."""
+    by_document = {}
+    for section in sections:
+        by_document.setdefault(section["document"], []).append(section)
+    return by_document
+
+def planned_calls(ranked_sections, llm_sections, persona, job_to_be_done):
+    """Model calls (first attempts, retries aside) that summarizing ranked_sections takes."""
+    calls = 0
+    for pdf_name, sections in group_by_document(ranked_sections).items():
+        generated, _ = route_sections(build_section_infos(sections, ""), llm_sections)
+        calls += len(plan_section_batches(pdf_name, generated, persona, job_to_be_done))
+    return calls
+
+def fan_out_duplicates(duplicates, extracted_sections, subsection_analysis):
+    """
+    (extracted section, subsection analysis) pairs for the near duplicates, each
+    carrying the summary of its cluster's representative; duplicates whose
+    representative has no summary are left out.
+    """
+    summaries = {section["importance_rank"]: analysis
+                 for section, analysis in zip(extracted_sections, subsection_analysis)}
+    copies = []
+    for duplicate, representative in duplicates:
+        analysis = summaries.get(representative["rank"])
+        if analysis is None:
+            continue
+        page = duplicate.get("page", 1)
+        copies.append((
+            {"document": duplicate["document"], "section_title": duplicate.get("text", ""),
+             "importance_rank": duplicate["rank"], "page_number": page},
+            {"document": duplicate["document"], "refined_text": analysis["refined_text"], "page_number": page},
+        ))
+    return copies
+
+def plan_extraction(runs, reindex=False):
+    """
+    The documents the runs still need parsed, as {pdf_path: [(run, name), ...]}, and
+    set each run's pending count. Documents already in the collection index and
+    unchanged since are skipped unless reindex.
+    """
+    owners = {}
+    for run in runs:
+        run.store.prune()
+        stale = set(run.documents if reindex else run.store.stale(run.documents))
+        fresh = [name for name in run.documents if name not in stale]
+        if fresh:
+            log(f"[{run.name}] {len(fresh)} of {len(run.documents)} document(s) unchanged in the collection index")
+            if run.embeddings is not None:
+                run.embeddings.add(run.store.sections(fresh))
+        run.pending = len(stale)
+        for name in run.documents:
+            if name in stale:
+                owners.setdefault(run.pdf_dir / name, []).append((run, name))
+    return owners
+
+def analyze_collections(runs, max_workers=None, use_parse_cache=True, max_in_flight=OLLAMA_MAX_IN_FLIGHT,
+                        top_k=RETRIEVAL_TOP_K, resume=False, llm_sections=LLM_SECTIONS, deadline=RUN_DEADLINE,
+                        near_duplicates=NEAR_DUP_MODE):
+    """
+    Process several collections in one go. All PDFs share one extraction pool and all
+    model calls share one client; each collection is ranked and summarized as soon as
+    its own documents are parsed, while the other collections are still parsing.
+    Documents already in the collection index and unchanged since are not parsed
+    at all; use_parse_cache=False re-parses and re-indexes everything.
+
+    deadline (seconds, 0 for none) bounds the whole run: the shortest documents are
+    parsed first, a collection stops waiting for its remaining documents when only
+    the time its model calls need is left, and summarization is fitted to the rest
+    (see summarize_collection). Every output is written before the deadline.
+    near_duplicates is the near-duplicate handling of summarize_collection.
+    """
+    started = time.perf_counter()
+    deadline = start_deadline(deadline, started)
+    # Parsed outlines and section text are reused across runs while the PDFs are unchanged
+    parse_cache = ParseCache() if use_parse_cache else None
+
+    owners = plan_extraction(runs, reindex=not use_parse_cache)
+    if deadline is not None and owners:
+        pages = {pdf_path: pdf_page_count(pdf_path) for pdf_path in owners}
+        owners = {pdf_path: owners[pdf_path] for pdf_path in sorted(owners, key=pages.get)}
+        log(f"Deadline {deadline.seconds:g}s: parsing {len(owners)} PDF(s), {sum(pages.values())} pages, "
+            f"estimated {default_costs.parse_seconds(sum(pages.values())):.1f}s of worker time")
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        for run in runs:
+            run.parsed = asyncio.Event()
+            if not run.pending:
+                run.parsed.set()
+
+        def extract_all():
+            # Parse every document in worker processes; each one is indexed as soon as it is
+            # ready (embedding calls included) while the others are still being parsed
+            if not owners:
+                return
+            try:
+                with ExtractionPool(workers=max_workers or EXTRACT_WORKERS, parse_cache=parse_cache) as pool:
+                    for pdf_path, parsed in pool.iter_completed(owners):
+                        timing = pool.timings.get(str(pdf_path), {})
+                        if "worker_seconds" in timing:
+                            default_costs.observe_parse(timing["pages"], timing["worker_seconds"])
+                        for run, name in owners[pdf_path]:
+                            log(f"[{run.name}] Processing PDF: {name}")
+                            run.add_document(name, prepare_sections(name, parsed))
+                            run.pending -= 1
+                            if not run.pending:
+                                run.timings["parsed_at"] = time.perf_counter() - started
+                                loop.call_soon_threadsafe(run.parsed.set)
+                        if deadline is not None and deadline.expired():
+                            log("Deadline reached; remaining PDFs are not parsed")
+                            break
+                log(f"Extraction timings:\n{pool.summary()}")
+            finally:
+                # Never leave a collection waiting on a failed extraction
+                for run in runs:
+                    loop.call_soon_threadsafe(run.parsed.set)
+
+        async def finish(run, client):
+            if deadline is None:
+                await run.parsed.wait()
+                if run.pending:
+                    return
+            else:
+                # Rank whatever is indexed once only the time for the model calls is left
+                try:
+                    await asyncio.wait_for(run.parsed.wait(),
+                                           max(0.0, deadline.remaining() - parse_reserve(llm_sections, deadline)))
+                except asyncio.TimeoutError:
+                    pass
+                if run.pending:
+                    log(f"[{run.name}] Deadline: ranking the {len(run.documents) - run.pending} of "
+                        f"{len(run.documents)} document(s) parsed so far")
+                    tracing.incr("deadline.unparsed_documents", run.pending)
+            with tracing.span("collection.summarize", collection=run.name):
+                await summarize_collection(run, client, top_k, resume, llm_sections, deadline=deadline,
+                                           near_duplicates=near_duplicates)
+            run.timings["done_at"] = time.perf_counter() - started
+
+        async with create_backend(max_in_flight=max_in_flight) as client:
+            await asyncio.gather(loop.run_in_executor(None, extract_all), *(finish(run, client) for run in runs))
+        log(f"LLM backend '{client.name}': {client.calls} model call(s)")
+
+    asyncio.run(main())
+    stats = default_cache().stats()
+    log(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses")
+    log("Per-collection timings:\n" + timing_summary(runs))
+    if tracing.write_trace():
+        log(f"Trace written to {tracing.TRACE_PATH}; stage metrics:\n{tracing.summary()}")
+    log("Done.")
+
+def timing_summary(runs):
+    lines = [f"  {'collection':<20} {'docs':>4} {'parsed at':>10} {'summarize':>10} {'done at':>8} {'sections':>8} "
+             f"{'calls saved':>11}"]
+    for run in runs:
+        t = run.timings
+        lines.append(
+            f"  {run.name:<20} {len(run.documents):>4} {t.get('parsed_at', 0):>9.2f}s {t.get('summarize', 0):>9.2f}s "
+            f"{t.get('done_at', 0):>7.2f}s {t.get('sections', 0):>8} {t.get('calls_saved', 0):>11}"
+        )
+    return "\n".join(lines)
+
+def analyze_collection_with_ollama(input_json_path, pdf_dir, output_json_path, delay=2, max_workers=None, use_parse_cache=True,
+                                  max_in_flight=OLLAMA_MAX_IN_FLIGHT, top_k=RETRIEVAL_TOP_K, resume=False,
+                                  llm_sections=LLM_SECTIONS, deadline=RUN_DEADLINE, near_duplicates=NEAR_DUP_MODE):
+    run = CollectionRun(input_json_path, pdf_dir, output_json_path)
+    analyze_collections([run], max_workers=max_workers, use_parse_cache=use_parse_cache,
+                        max_in_flight=max_in_flight, top_k=top_k, resume=resume, llm_sections=llm_sections,
+                        deadline=deadline, near_duplicates=near_duplicates)
 
+def write_output(output_json_path, input_documents, persona, job_to_be_done, extracted_sections, subsection_analysis):
     output = {
         "metadata": {
             "input_documents": input_documents,
@@ -177,136 +546,151 @@ def analyze_collection_with_ollama(input_json_path, pdf_dir, output_json_path, d
         "extracted_sections": extracted_sections,
         "subsection_analysis": subsection_analysis
     }
-
     log(f"Writing output to {output_json_path}")
-    with open(output_json_path, "w", encoding="utf-8") as f:
+    with tracing.span("output.write", output=str(output_json_path)), open(output_json_path, "w", encoding="utf-8") as f:
         json.dump(output, f, indent=4, ensure_ascii=False)
-    log("Done.")
+    return output
 
-def analyze_pdf_with_llm(pdf_name, flat_outline, persona, job_to_be_done, pdf_text):
-    """
-    For each section, ask the LLM for a summary and let it decide if it's relevant. Build the output JSON manually.
-    """
-    # Batch all section summaries in a single LLM call for speed
-    import re
-    extracted_sections = []
-    subsection_analysis = []
-    # Prepare a list of section info for the prompt
+def build_section_infos(flat_outline, pdf_text):
+    """Number the sections and attach the excerpt each one is prompted with."""
     section_infos = []
     for idx, section in enumerate(flat_outline, start=1):
-        heading = section.get("text", "")
-        page = section.get("page", 1)
-        # Get a short excerpt for each section (simulate section text)
-        excerpt = pdf_text[:400] if pdf_text else ""
+        # Use the section's own body when it was segmented, else the document start
+        excerpt = section.get("excerpt")
+        if excerpt is None:
+            excerpt = pdf_text[:400] if pdf_text else ""
         section_infos.append({
             "idx": idx,
-            "heading": heading,
-            "page": page,
-            "excerpt": excerpt
+            "heading": section.get("text", ""),
+            "page": section.get("page", 1),
+            "rank": section.get("rank"),
+            "excerpt": truncate_to_tokens(excerpt, EXCERPT_TOKEN_BUDGET),
+            "body": section.get("body") or excerpt
         })
+    return section_infos
 
+def route_sections(sections, llm_sections=LLM_SECTIONS):
+    """
+    (sections for the model, sections to summarize extractively), split on collection
+    rank; sections without a rank fall back to their position in the document.
+    """
+    if llm_sections < 0:
+        return list(sections), []
+    generated, extracted = [], []
+    for position, section in enumerate(sections, start=1):
+        rank = section.get("rank") or section.get("idx") or position
+        (generated if rank <= llm_sections else extracted).append(section)
+    return generated, extracted
 
+def extractive_items(section_infos, persona, job_to_be_done):
+    """{idx, summary} items for sections summarized without the model."""
+    query = build_query(persona, job_to_be_done)
+    return [{"idx": info["idx"], "summary": extractive_summary(info["body"], query, fallback=info["heading"])}
+            for info in section_infos]
 
-    # Batch all sections at once, use very short excerpts (20 chars)
-    import ast
-    batch_all = False
-    if len(locals()) > 5 and 'batch_all' in locals():
-        batch_all = locals()['batch_all']
-    if batch_all:
-        batch = section_infos
-        prompt = (
-            f"You are an expert assistant for a {persona} whose job is: {job_to_be_done}.\n"
-            f"Given the following sections from '{pdf_name}', summarize each section for the job.\n"
-            "Return a JSON array ONLY, where each item is: {'idx': <idx>, 'summary': <summary>}\n"
-            "Sections:\n"
-        )
-        for info in batch:
-            prompt += f"- idx: {info['idx']}, heading: {info['heading']}, excerpt: {info['excerpt'][:20]}\n"
-        prompt += ("\nExample output:\n[{'idx': 1, 'summary': '...'}, {'idx': 2, 'summary': '...'}]\n"
-                   "Output the JSON array only. Do not add any explanation or code block.")
-
-        response = call_ollama(prompt)
-        json_str = response.strip()
-        if json_str.startswith('```'):
-            json_str = re.sub(r'^```[a-zA-Z]*', '', json_str).strip()
-            if json_str.endswith('```'):
-                json_str = json_str[:-3].strip()
-        match = re.search(r'(\[.*?\])', json_str, re.DOTALL)
-        if match:
-            json_str = match.group(1)
-        json_str_fixed = json_str.replace("'", '"')
-        results = None
-        try:
-            results = json.loads(json_str_fixed)
-        except Exception:
-            try:
-                results = ast.literal_eval(json_str)
-            except Exception:
-                results = []
-        for item in results:
-            idx = item.get('idx')
-            summary = item.get('summary', '')
-            section = section_infos[idx-1]
-            extracted_sections.append({
-                "document": pdf_name,
-                "section_title": section["heading"],
-                "importance_rank": len(extracted_sections) + 1,
-                "page_number": section["page"]
-            })
-            subsection_analysis.append({
-                "document": pdf_name,
-                "refined_text": summary,
-                "page_number": section["page"]
-            })
-    else:
-        batch_size = 5
-        for i in range(0, len(section_infos), batch_size):
-            batch = section_infos[i:i+batch_size]
-            prompt = (
-                f"You are an expert assistant for a {persona} whose job is: {job_to_be_done}.\n"
-                f"Given the following sections from '{pdf_name}', summarize each section for the job.\n"
-                "Return a JSON array ONLY, where each item is: {'idx': <idx>, 'summary': <summary>}\n"
-                "Sections:\n"
-            )
-            for info in batch:
-                prompt += f"- idx: {info['idx']}, heading: {info['heading']}, excerpt: {info['excerpt'][:20]}\n"
-            prompt += ("\nExample output:\n[{'idx': 1, 'summary': '...'}, {'idx': 2, 'summary': '...'}]\n"
-                       "Output the JSON array only. Do not add any explanation or code block.")
-
-            response = call_ollama(prompt)
-            json_str = response.strip()
-            if json_str.startswith('```'):
-                json_str = re.sub(r'^```[a-zA-Z]*', '', json_str).strip()
-                if json_str.endswith('```'):
-                    json_str = json_str[:-3].strip()
-            match = re.search(r'(\[.*?\])', json_str, re.DOTALL)
-            if match:
-                json_str = match.group(1)
-            json_str_fixed = json_str.replace("'", '"')
-            results = None
-            try:
-                results = json.loads(json_str_fixed)
-            except Exception:
-                try:
-                    results = ast.literal_eval(json_str)
-                except Exception:
-                    results = []
-            for item in results:
-                idx = item.get('idx')
-                summary = item.get('summary', '')
-                section = section_infos[idx-1]
-                extracted_sections.append({
-                    "document": pdf_name,
-                    "section_title": section["heading"],
-                    "importance_rank": len(extracted_sections) + 1,
-                    "page_number": section["page"]
-                })
-                subsection_analysis.append({
-                    "document": pdf_name,
-                    "refined_text": summary,
-                    "page_number": section["page"]
-                })
+def section_prompt_line(info):
+    return f"- idx: {info['idx']}, heading: {info['heading']}, excerpt: {info['excerpt']}\n"
+
+def batch_prompt_prefix(persona, job_to_be_done):
+    """
+    The start of every batch prompt for a persona and job. It is byte-identical
+    across documents and batches, so the server can evaluate it once (see
+    ollama_client); everything document-specific goes after it. It ends on a
+    non-whitespace character: tokenizers merge runs of newlines into one token, so a
+    trailing newline would tokenize differently alone than followed by the rest.
+    """
+    return (
+        f"You are an expert assistant for a {persona} whose job is: {job_to_be_done}.\n"
+        "You will be given sections from a PDF document. Summarize each section for the job.\n"
+        'Return a JSON array ONLY, where each item is: {"idx": <idx>, "summary": "<summary>"}\n'
+        'Example output:\n[{"idx": 1, "summary": "..."}, {"idx": 2, "summary": "..."}]\n'
+        "Output the JSON array only. Do not add any explanation or code block."
+    )
+
+def build_batch_prompt(pdf_name, batch, persona, job_to_be_done):
+    prompt = batch_prompt_prefix(persona, job_to_be_done) + f"\n\nSections from '{pdf_name}':\n"
+    for info in batch:
+        prompt += section_prompt_line(info)
+    return prompt
+
+def plan_section_batches(pdf_name, section_infos, persona, job_to_be_done):
+    """Pack a document's sections into as few prompts as fit the model's context."""
+    fixed_tokens = estimate_tokens(build_batch_prompt(pdf_name, [], persona, job_to_be_done))
+    line_tokens = [estimate_tokens(section_prompt_line(info)) for info in section_infos]
+    return plan_batches(section_infos, fixed_tokens, line_tokens)
+
+def batch_items(batch, results):
+    """The parsed items that answer a section of this batch (one per section)."""
+    wanted = {info["idx"] for info in batch}
+    items = {}
+    for item in results:
+        idx = item.get("idx")
+        if idx in wanted and idx not in items:
+            items[idx] = item
+    return list(items.values())
+
+def answers_batch(batch):
+    """
+    cache_if for a batch call: a response is only cached when it has a parsed summary
+    for every section of the batch, so partial or unparseable answers are asked again.
+    """
+    return lambda response: len(batch_items(batch, parse_batch_response(response))) == len(batch)
+
+def retry_batches(batch, items, response):
+    """
+    Follow-up batches for the sections of batch that got no parsed summary: the missing
+    sections on their own, or both halves when nothing parsed. A call that failed before
+    producing anything, or a single unparseable section, is not retried.
+    """
+    answered = {item["idx"] for item in items}
+    missing = [info for info in batch if info["idx"] not in answered]
+    if not missing or not (response or items):
+        return []
+    if len(missing) < len(batch):
+        return [missing]
+    if len(batch) > 1:
+        return split_batch(batch)
+    return []
 
+def parse_batch_response(response):
+    """Best-effort decode of the model's JSON array of {idx, summary} items."""
+    return StreamingItemParser().finish(response)
+
+def collect_batch_results(pdf_name, section_infos, results, extracted_sections, subsection_analysis):
+    for item in results:
+        idx = item.get('idx')
+        summary = item.get('summary', '')
+        if not isinstance(idx, int) or not 1 <= idx <= len(section_infos):
+            continue
+        section = section_infos[idx-1]
+        extracted_sections.append({
+            "document": pdf_name,
+            "section_title": section["heading"],
+            # Without a collection rank, the section's position in the document (as in route_sections)
+            "importance_rank": section["rank"] or section["idx"],
+            "page_number": section["page"]
+        })
+        subsection_analysis.append({
+            "document": pdf_name,
+            "refined_text": summary,
+            "page_number": section["page"]
+        })
+
+def fill_unanswered(pdf_name, section_infos, generated, answered, persona, job_to_be_done,
+                    extracted_sections, subsection_analysis):
+    """
+    Summarize extractively the sections of generated that got no model summary (failed,
+    skipped or timed-out calls), so none is dropped; returns how many there were.
+    """
+    missing = [info for info in generated if info["idx"] not in answered]
+    if missing:
+        log(f"{len(missing)} section(s) of {pdf_name} got no model summary; summarized extractively")
+        tracing.incr("llm.unanswered_sections", len(missing))
+        collect_batch_results(pdf_name, section_infos, extractive_items(missing, persona, job_to_be_done),
+                              extracted_sections, subsection_analysis)
+    return len(missing)
+
+def finish_pdf_results(pdf_name, flat_outline, extracted_sections, subsection_analysis, response):
     # If still nothing, treat the whole response as a summary for the first section
     if not extracted_sections and flat_outline:
         heading = flat_outline[0].get("text", "")
@@ -314,7 +698,7 @@ def analyze_pdf_with_llm(pdf_name, flat_outline, persona, job_to_be_done, pdf_te
         extracted_sections.append({
             "document": pdf_name,
             "section_title": heading,
-            "importance_rank": 1,
+            "importance_rank": flat_outline[0].get("rank") or 1,
             "page_number": page
         })
         subsection_analysis.append({
@@ -322,26 +706,157 @@ def analyze_pdf_with_llm(pdf_name, flat_outline, persona, job_to_be_done, pdf_te
             "refined_text": response.strip(),
             "page_number": page
         })
-    return {"extracted_sections": extracted_sections, "subsection_analysis": subsection_analysis}
+    # Extractive sections are collected before the model's, so put them back in rank order
+    pairs = sorted(zip(extracted_sections, subsection_analysis), key=lambda p: p[0]["importance_rank"])
+    return {"extracted_sections": [p[0] for p in pairs], "subsection_analysis": [p[1] for p in pairs]}
+
+def analyze_pdf_with_llm(pdf_name, flat_outline, persona, job_to_be_done, pdf_text, llm_sections=LLM_SECTIONS):
+    """
+    For each section, ask the LLM for a summary and let it decide if it's relevant. Build the output JSON manually.
+    The model is whichever LLM_BACKEND is configured (Ollama over HTTP, a local in-process model, or the stub).
+    Only sections ranked within llm_sections go to the model; the others, and those the
+    model left unanswered, get an extractive summary.
+    """
+    extracted_sections = []
+    subsection_analysis = []
+    section_infos = build_section_infos(flat_outline, pdf_text)
+    generated, extractive = route_sections(section_infos, llm_sections)
+    collect_batch_results(pdf_name, section_infos, extractive_items(extractive, persona, job_to_be_done),
+                          extracted_sections, subsection_analysis)
 
+    response = ""
+    answered = set()
+    pending = plan_section_batches(pdf_name, generated, persona, job_to_be_done)
+    while pending:
+        batch = pending.pop(0)
+        with tracing.span("batch", document=pdf_name, batch=batch_key(pdf_name, batch), sections=len(batch)):
+            with tracing.span("prompt.build"):
+                prompt = build_batch_prompt(pdf_name, batch, persona, job_to_be_done)
+            parser = StreamingItemParser()
+            with tracing.span("llm.wait"):
+                response = complete(prompt, options=generation_options(len(batch)), format=batch_format(),
+                                    on_text=parser.feed, prefix=batch_prompt_prefix(persona, job_to_be_done),
+                                    cache_if=answers_batch(batch))
+            with tracing.span("response.parse"):
+                items = batch_items(batch, parser.finish(response))
+        collect_batch_results(pdf_name, section_infos, items, extracted_sections, subsection_analysis)
+        answered.update(item["idx"] for item in items)
+        pending[:0] = retry_batches(batch, items, response)
+    fill_unanswered(pdf_name, section_infos, generated, answered, persona, job_to_be_done,
+                    extracted_sections, subsection_analysis)
+    return finish_pdf_results(pdf_name, flat_outline, extracted_sections, subsection_analysis, response)
 
-if __name__ == "__main__":
-    analyze_collection_with_ollama(
-        input_json_path="Collection 1/challenge1b_input.json",
-        pdf_dir="Collection 1/PDFs",
-        output_json_path="Collection 1/challenge1b_output.json"
-    )
+async def analyze_pdf_with_llm_async(pdf_name, flat_outline, persona, job_to_be_done, pdf_text, client,
+                                     journal=None, llm_sections=LLM_SECTIONS, deadline=None):
+    """
+    Same output as analyze_pdf_with_llm, but all batches of the document are sent
+    concurrently through client (a backend from llm_backend). With a RunJournal, each batch
+    is recorded as it finishes and batches already in the journal are not re-sent.
+    Sections ranked beyond llm_sections are summarized extractively, as in the sync version.
+    With a Deadline, calls are not started (and running ones time out) when they cannot
+    finish in time. Every section left without a model summary, whether its call failed
+    or was skipped, is summarized extractively; the result then carries "degraded": True.
+    """
+    extracted_sections = []
+    subsection_analysis = []
+    section_infos = build_section_infos(flat_outline, pdf_text)
 
-# To run on a different collection, change the arguments below as needed.
-# Example for Collection 2:
-# analyze_collection_with_ollama(
-#     input_json_path="Collection 2/challenge1b_input.json",
-#     pdf_dir="Collection 2/PDFs",
-#     output_json_path="Collection 2/challenge1b_output_general.json"
-# )
-# Example for Collection 3:
-# analyze_collection_with_ollama(
-#     input_json_path="Collection 3/challenge1b_input.json",
-#     pdf_dir="Collection 3/PDFs",
-#     output_json_path="Collection 3/challenge1b_output_general.json"
-# )
+    async def run_batch(batch):
+        """(last response, parsed items) for a batch, including any split retries."""
+        key = batch_key(pdf_name, batch)
+        if journal is not None and journal.batch(key) is not None:
+            record = journal.batch(key)
+            response, results = record["response"], record["results"]
+        elif deadline is not None and not deadline.allows(default_costs.call_seconds(len(batch))):
+            tracing.incr("deadline.skipped_sections", len(batch))
+            return "", []
+        else:
+            with tracing.span("prompt.build", document=pdf_name, batch=key):
+                prompt = build_batch_prompt(pdf_name, batch, persona, job_to_be_done)
+            # Items are decoded as they stream in, so those finished before a timeout are kept
+            parser = StreamingItemParser()
+            # llm.wait includes queueing for a free slot; llm.http inside it is the request itself
+            timeout = deadline.timeout(getattr(client, "timeout", None)) if deadline is not None else None
+            started = time.perf_counter()
+            with tracing.span("llm.wait", document=pdf_name, batch=key, sections=len(batch)):
+                response = await client.generate(prompt, options=generation_options(len(batch)), timeout=timeout,
+                                                 format=client.structured_format, on_text=parser.feed,
+                                                 prefix=batch_prompt_prefix(persona, job_to_be_done),
+                                                 cache_if=answers_batch(batch))
+            if response:
+                # Latency as seen by the caller, queueing for a free slot included
+                default_costs.observe_call(len(batch), time.perf_counter() - started)
+            with tracing.span("response.parse", document=pdf_name, batch=key):
+                results = parser.finish(response)
+            # Failed calls are not journaled, so a resumed run retries them
+            if journal is not None and response:
+                journal.record_batch(pdf_name, key, response, results)
+        items = batch_items(batch, results)
+        retries = retry_batches(batch, items, response)
+        if retries:
+            log(f"Retrying {sum(map(len, retries))} unparsed section(s) of {pdf_name} in {len(retries)} batch(es)")
+            for retry_response, retry_items in await asyncio.gather(*(run_batch(b) for b in retries)):
+                items.extend(retry_items)
+                response = retry_response or response
+        return response, items
+
+    generated, extractive = route_sections(section_infos, llm_sections)
+    with tracing.span("extractive.summarize", document=pdf_name, sections=len(extractive)):
+        collect_batch_results(pdf_name, section_infos, extractive_items(extractive, persona, job_to_be_done),
+                              extracted_sections, subsection_analysis)
+    batches = plan_section_batches(pdf_name, generated, persona, job_to_be_done)
+    outcomes = await asyncio.gather(*(run_batch(batch) for batch in batches))
+    for _, items in outcomes:
+        collect_batch_results(pdf_name, section_infos, items, extracted_sections, subsection_analysis)
+    answered = {item["idx"] for _, items in outcomes for item in items}
+    missing = fill_unanswered(pdf_name, section_infos, generated, answered, persona, job_to_be_done,
+                              extracted_sections, subsection_analysis)
+    last_response = outcomes[-1][0] if outcomes else ""
+    result = finish_pdf_results(pdf_name, flat_outline, extracted_sections, subsection_analysis, last_response)
+    if missing:
+        # Marks the result for the journal: these sections were meant for the model
+        result["degraded"] = True
+    return result
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Persona-driven section extraction with Ollama.")
+    parser.add_argument("collections", nargs="*",
+                        help="collection directories or challenge1b_input.json paths "
+                             "(default: every 'Collection */challenge1b_input.json' here)")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip documents and batches already recorded in each output's journal")
+    parser.add_argument("--workers", type=int, default=None, help="extraction processes (default: all cores)")
+    parser.add_argument("--max-in-flight", type=int, default=OLLAMA_MAX_IN_FLIGHT,
+                        help="concurrent model calls per Ollama endpoint, across all collections")
+    parser.add_argument("--top-k", type=int, default=RETRIEVAL_TOP_K, help="sections summarized per collection")
+    parser.add_argument("--llm-sections", type=int, default=LLM_SECTIONS,
+                        help="top-ranked sections per collection summarized by the model; the rest are "
+                             "summarized extractively (negative: all)")
+    parser.add_argument("--deadline", type=float, default=RUN_DEADLINE, metavar="SECONDS",
+                        help="write every output within this many seconds, degrading to extractive "
+                             "summaries as needed (same as RUN_DEADLINE; 0: no deadline)")
+    parser.add_argument("--near-duplicates", choices=("fanout", "collapse", "off"), default=NEAR_DUP_MODE,
+                        help="summarize near-duplicate sections once and copy the summary to each occurrence "
+                             "(fanout), keep only the best-ranked occurrence (collapse), or summarize each (off); "
+                             "same as NEAR_DUP_MODE")
+    parser.add_argument("--trace", metavar="PATH", default=None,
+                        help="write per-stage trace events and metrics to PATH (same as TRACE_PATH)")
+    args = parser.parse_args(argv)
+
+    paths = args.collections or sorted(str(p) for p in Path(".").glob("Collection */challenge1b_input.json"))
+    if not paths:
+        parser.error("no collections given and none found in the current directory")
+    runs = list({str(run.input_json_path.resolve()): run for run in map(CollectionRun.from_path, paths)}.values())
+    if args.trace:
+        tracing.enable(args.trace)
+    # TRACE_PROFILE=<file> runs the whole analysis under cProfile
+    with tracing.profiled():
+        analyze_collections(runs, max_workers=args.workers, max_in_flight=args.max_in_flight,
+                            top_k=args.top_k, resume=args.resume, llm_sections=args.llm_sections,
+                            deadline=args.deadline, near_duplicates=args.near_duplicates)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Incremental and watch modes for the outline extractor (process_pdfs.py).
+
+A manifest in the output directory (.outline_manifest.json) records, for every
+PDF whose outline was written, its size, mtime, content hash and the extractor
+version (including OUTLINE_USE_TOC). A sync pass then only extracts PDFs that
+are new or changed, on all cores through the ExtractionPool. A PDF whose size or mtime changed but whose
+hash did not is only re-recorded. Outputs of PDFs that were deleted from the
+input directory are removed. A PDF that fails to parse (e.g. still being
+copied) is left out of the manifest and retried on the next pass.
+
+Watch mode runs a sync pass, then another one whenever the input directory
+changes, once it has been quiet for WATCH_DEBOUNCE seconds. Changes are seen
+through filesystem events with the optional `watchdog` package, or by polling
+the directory listing every WATCH_POLL seconds without it.
+
+Usage:
+    python process_pdfs.py --incremental [--input input --output output]
+    python process_pdfs.py --watch [--debounce 2]
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from parse_cache import file_digest
+from process_pdfs import extractor_version, write_outline_json
+
+MANIFEST_NAME = ".outline_manifest.json"
+WATCH_DEBOUNCE = float(os.environ.get("WATCH_DEBOUNCE", "2"))
+WATCH_POLL = float(os.environ.get("WATCH_POLL", "2"))
+# Manifest writes during a long pass, so an interrupted pass keeps its progress
+MANIFEST_SAVE_EVERY = 50
+
+
+class Manifest:
+    """{pdf name: {"size", "mtime_ns", "digest", "output"}} of one output directory, kept as JSON."""
+
+    def __init__(self, output_dir):
+        self.path = Path(output_dir) / MANIFEST_NAME
+        self.files = {}
+        if self.path.exists():
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except ValueError:
+                data = {}
+            # Outputs of another extractor version are all stale
+            if data.get("version") == extractor_version():
+                self.files = data.get("files", {})
+
+    def save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": extractor_version(), "files": self.files}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def is_current(self, pdf_path, output_path, stat) -> bool:
+        """True when pdf_path's outline in output_path is up to date (rehashing only if size/mtime moved)."""
+        record = self.files.get(pdf_path.name)
+        if record is None or not output_path.exists():
+            return False
+        if (record["size"], record["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            return True
+        if file_digest(pdf_path) != record["digest"]:
+            return False
+        record.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        return True
+
+    def record(self, pdf_path, output_path, stat, digest):
+        """Record an extracted PDF with the stat and digest taken before its extraction."""
+        self.files[pdf_path.name] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                     "digest": digest, "output": output_path.name}
+
+
+def output_path_for(pdf_path, output_dir) -> Path:
+    return Path(output_dir) / f"{pdf_path.stem}.json"
+
+
+def sync_outlines(input_dir, output_dir, pool, manifest=None):
+    """
+    One incremental pass: extract new and changed PDFs, drop outputs of deleted ones.
+    Returns {"written": [...], "removed": [...], "failed": [...], "unchanged": n}.
+    """
+    input_dir, output_dir = Path(input_dir), Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = manifest or Manifest(output_dir)
+    pdfs = {p.name: p for p in input_dir.glob("*.pdf")}
+
+    snapshots = {}
+    stale = []
+    for name, pdf_path in sorted(pdfs.items()):
+        try:
+            stat = pdf_path.stat()
+            if manifest.is_current(pdf_path, output_path_for(pdf_path, output_dir), stat):
+                continue
+            # Stat and digest are both taken before extraction: a PDF that changes
+            # meanwhile no longer matches its record and is picked up next pass
+            snapshots[pdf_path] = (stat, file_digest(pdf_path))
+        except FileNotFoundError:
+            continue
+        stale.append(pdf_path)
+
+    removed = []
+    for name in [name for name in manifest.files if name not in pdfs]:
+        output = output_dir / manifest.files.pop(name)["output"]
+        if output.exists():
+            output.unlink()
+        removed.append(name)
+
+    written = []
+    errors = []
+    for pdf_path, entry in pool.iter_completed(stale, errors=errors):
+        output_path = output_path_for(pdf_path, output_dir)
+        write_outline_json(entry["tree"], output_path)
+        manifest.record(pdf_path, output_path, *snapshots[pdf_path])
+        written.append(pdf_path.name)
+        if len(written) % MANIFEST_SAVE_EVERY == 0:
+            manifest.save()
+    for pdf_path, error in errors:
+        print(f"Could not extract {pdf_path.name}: {error!r}; retrying on the next pass")
+    manifest.save()
+    return {"written": written, "removed": removed, "failed": [p.name for p, _ in errors],
+            "unchanged": len(pdfs) - len(stale)}
+
+
+class _PollingChanges:
+    """Change detection by comparing the directory's (name, size, mtime) listing."""
+
+    def __init__(self, directory, interval=WATCH_POLL):
+        self.directory = Path(directory)
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for path in self.directory.glob("*.pdf"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            snapshot[path.name] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout=None) -> bool:
+        """Block until the listing changes (True) or timeout seconds pass (False)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            delay = self.interval if deadline is None else min(self.interval, max(0.0, deadline - time.monotonic()))
+            time.sleep(delay)
+            snapshot = self._scan()
+            if snapshot != self._snapshot:
+                self._snapshot = snapshot
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def close(self):
+        pass
+
+
+class _WatchdogChanges:
+    """Change detection from filesystem events (watchdog)."""
+
+    def __init__(self, directory):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        self._changed = threading.Event()
+        changed = self._changed
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = (getattr(event, "src_path", ""), getattr(event, "dest_path", ""))
+                if any(str(p).lower().endswith(".pdf") for p in paths):
+                    changed.set()
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), str(directory), recursive=False)
+        self._observer.start()
+
+    def wait(self, timeout=None) -> bool:
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+    def close(self):
+        self._observer.stop()
+        self._observer.join()
+
+
+def watch_changes(directory, poll=WATCH_POLL):
+    """Filesystem-event change source when watchdog is installed, polling otherwise."""
+    try:
+        return _WatchdogChanges(directory)
+    except ImportError:
+        print(f"watchdog is not installed (pip install watchdog); polling {directory} every {poll:g}s")
+        return _PollingChanges(directory, poll)
+
+
+def report(result, seconds):
+    print(f"Sync: {len(result['written'])} written, {len(result['removed'])} removed, "
+          f"{len(result['failed'])} failed, {result['unchanged']} unchanged in {seconds:.2f}s")
+
+
+def run_incremental(input_dir, output_dir, pool):
+    started = time.perf_counter()
+    result = sync_outlines(input_dir, output_dir, pool)
+    report(result, time.perf_counter() - started)
+    return result
+
+
+def watch(input_dir, output_dir, pool, debounce=WATCH_DEBOUNCE, poll=WATCH_POLL):
+    """Sync now, then after every burst of changes in input_dir; runs until interrupted."""
+    manifest = Manifest(output_dir)
+    changes = watch_changes(input_dir, poll)
+    print(f"Watching {Path(input_dir).resolve()} (debounce {debounce:g}s); Ctrl+C to stop")
+    try:
+        while True:
+            started = time.perf_counter()
+            report(sync_outlines(input_dir, output_dir, pool, manifest), time.perf_counter() - started)
+            changes.wait()
+            # Debounce: wait until no change arrived for a full interval
+            while changes.wait(debounce):
+                pass
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        changes.close()
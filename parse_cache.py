@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Persistent, content-addressed cache of parsed PDFs.
+
+Entries are keyed by the SHA-256 of the file bytes plus the extractor version
+(EXTRACTOR_VERSION and OUTLINE_USE_TOC, see process_pdfs.extractor_version) and
+hold the outline tree, the document's text lines and each heading's line range,
+stored as zlib-compressed JSON in a single SQLite file. Least recently used entries are
+evicted once the cache grows past its size limit.
+
+Usage:
+    python parse_cache.py stats
+    python parse_cache.py clear
+    python parse_cache.py invalidate "Collection 1/PDFs/South of France - Cities.pdf" ...
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import tracing
+from process_pdfs import ParsedDocument, extractor_version
+from section_text import SectionSegmenter, join_lines, section_key
+
+PARSE_CACHE_PATH = os.environ.get(
+    "PARSE_CACHE_PATH", str(Path(__file__).parent / ".cache" / "parse_cache.sqlite")
+)
+PARSE_CACHE_MAX_MB = float(os.environ.get("PARSE_CACHE_MAX_MB", "256"))
+
+
+def file_digest(pdf_path: Path) -> str:
+    h = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def parse_entry(pdf_path: Path) -> dict:
+    """
+    Parse a PDF into the cached representation: the outline tree, the document's
+    lines, and for every heading the [start, stop) range of its body lines.
+    """
+    return document_entry(ParsedDocument(pdf_path))
+
+
+def document_entry(doc) -> dict:
+    """parse_entry for an already decoded ParsedDocument."""
+    tree = doc.outline_tree
+    with tracing.span("sections.segment", document=doc.path.name):
+        segmenter = SectionSegmenter(doc)
+        ranges = {}
+        stack = list(tree)
+        while stack:
+            node = stack.pop()
+            ranges[section_key(node)] = list(segmenter.line_range(node))
+            stack.extend(node.get("children", []))
+    return {
+        "tree": tree,
+        "lines": segmenter.lines,
+        "ranges": ranges,
+        "page_count": doc.page_count,
+        "outline_source": doc.outline_source,
+    }
+
+
+def section_body(entry: dict, section, token_budget=None) -> str:
+    """Body text of a section from a parse_entry result."""
+    start, stop = entry["ranges"].get(section_key(section), (0, 0))
+    return join_lines(entry["lines"][start:stop], token_budget)
+
+
+class ParseCache:
+    """SQLite-backed store of parse_entry results, safe to share across threads."""
+
+    def __init__(self, path=PARSE_CACHE_PATH, max_mb=PARSE_CACHE_MAX_MB):
+        self.path = Path(path)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, source TEXT, size INTEGER, last_used REAL, data BLOB)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key_for(pdf_path: Path) -> str:
+        return f"{file_digest(pdf_path)}:{extractor_version()}"
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key, entry, source=""):
+        data = zlib.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, source, size, last_used, data) VALUES (?, ?, ?, ?, ?)",
+                (key, str(source), len(data), time.time(), data)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_used ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+    def invalidate(self, pdf_path: Path) -> int:
+        """Drop every cached version of a file (matched by content and by path)."""
+        digest = file_digest(pdf_path) if Path(pdf_path).exists() else None
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM entries WHERE source = ? OR key LIKE ?",
+                (str(pdf_path), f"{digest}:%" if digest else "")
+            )
+            self._conn.commit()
+        return cur.rowcount
+
+    def clear(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+        return cur.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {"entries": count, "bytes": size, "max_bytes": self.max_bytes, "path": str(self.path)}
+
+
+def load_parsed(pdf_path: Path, cache=None) -> dict:
+    """Return parse_entry(pdf_path), from the cache when the file content is unchanged."""
+    if cache is None:
+        return parse_entry(pdf_path)
+    key = cache.key_for(pdf_path)
+    entry = cache.get(key)
+    if entry is None:
+        entry = parse_entry(pdf_path)
+        cache.put(key, entry, source=pdf_path)
+    return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the parsed-PDF cache.")
+    parser.add_argument("command", choices=["stats", "clear", "invalidate"])
+    parser.add_argument("pdfs", nargs="*", type=Path)
+    args = parser.parse_args()
+
+    cache = ParseCache()
+    if args.command == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == "clear":
+        print(f"Removed {cache.clear()} entries.")
+    else:
+        removed = sum(cache.invalidate(p) for p in args.pdfs)
+        print(f"Removed {removed} entries.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,8 @@
 Enhanced PDF Outline Extractor using PyMuPDF (fitz)
 
 Features:
-- Infers heading levels by font size
+- Uses the embedded PDF outline (bookmarks) when present and plausible
+- Otherwise infers heading levels by font size
 - Semantic filters to discard non-heading text, form labels (text containing ':')
 - Skips pure numeric labels ≥4 digits
 - Uses first extracted H1 as title (no forced first-page detection)
@@ -12,11 +13,28 @@ Features:
 - Outputs JSON in specified structure
 """
 
+import bisect
 import fitz  # PyMuPDF
+import os
 import re
 import json
+import numpy as np
 from pathlib import Path
-from collections import defaultdict
+
+import tracing
+
+# Bump whenever a change alters extracted spans, headings or section text,
+# so persisted parse results from older extractors are not reused.
+EXTRACTOR_VERSION = "3"
+# Stop streaming pages once this many headings were found (0: read every page)
+OUTLINE_MAX_SECTIONS = int(os.environ.get("OUTLINE_MAX_SECTIONS", "0"))
+# Take headings from the PDF's embedded outline (bookmarks) when it has a plausible one
+OUTLINE_USE_TOC = os.environ.get("OUTLINE_USE_TOC", "1") not in ("", "0", "false", "False")
+
+
+def extractor_version() -> str:
+    """EXTRACTOR_VERSION plus the settings that change the heading tree, for cache keys."""
+    return EXTRACTOR_VERSION if OUTLINE_USE_TOC else f"{EXTRACTOR_VERSION}-notoc"
 
 
 def clean_text(s: str) -> str:
@@ -46,11 +64,393 @@ def is_likely_heading(text: str) -> bool:
     return True
 
 
-def extract_outline_tree(pdf_path: Path, pdf_dir: Path, max_levels: int = 4):
+class SpanTable:
+    """
+    Columnar store of text spans: one array per attribute, with every span's text
+    kept as an offset range into a single shared buffer.
+    """
+
+    __slots__ = ("size", "bold", "page", "y", "text_start", "text_end", "buffer")
+
+    def __init__(self, sizes, bolds, pages, ys, texts):
+        self.size = np.asarray(sizes, dtype=np.float64)
+        self.bold = np.asarray(bolds, dtype=bool)
+        self.page = np.asarray(pages, dtype=np.int64)
+        self.y = np.asarray(ys, dtype=np.float64)
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        self.text_end = np.cumsum(lengths)
+        self.text_start = self.text_end - lengths
+        self.buffer = "".join(texts)
+
+    @classmethod
+    def concat(cls, tables):
+        table = cls.__new__(cls)
+        table.size = np.concatenate([t.size for t in tables]) if tables else np.empty(0)
+        table.bold = np.concatenate([t.bold for t in tables]) if tables else np.empty(0, dtype=bool)
+        table.page = np.concatenate([t.page for t in tables]) if tables else np.empty(0, dtype=np.int64)
+        table.y = np.concatenate([t.y for t in tables]) if tables else np.empty(0)
+        starts, ends, offset = [], [], 0
+        for t in tables:
+            starts.append(t.text_start + offset)
+            ends.append(t.text_end + offset)
+            offset += len(t.buffer)
+        table.text_start = np.concatenate(starts) if tables else np.empty(0, dtype=np.int64)
+        table.text_end = np.concatenate(ends) if tables else np.empty(0, dtype=np.int64)
+        table.buffer = "".join(t.buffer for t in tables)
+        return table
+
+    def __len__(self):
+        return len(self.size)
+
+    def text(self, i) -> str:
+        return self.buffer[self.text_start[i]:self.text_end[i]]
+
+    def group_lines(self):
+        """
+        Group spans sharing (page, y) into lines, in reading order.
+        Returns (page, y, size, bold) arrays with one entry per line (size is the
+        largest span size, bold is set if any span is bold) and the list of raw line texts.
+        """
+        n = len(self)
+        if n == 0:
+            empty = np.empty(0)
+            return empty.astype(np.int64), empty, empty, empty.astype(bool), []
+        # Stable sort, so spans keep their original order within a line
+        order = np.lexsort((self.y, self.page))
+        page = self.page[order]
+        y = self.y[order]
+        is_first = np.empty(n, dtype=bool)
+        is_first[0] = True
+        is_first[1:] = (page[1:] != page[:-1]) | (y[1:] != y[:-1])
+        firsts = np.flatnonzero(is_first)
+        size = np.maximum(np.maximum.reduceat(self.size[order], firsts), 0)
+        bold = np.logical_or.reduceat(self.bold[order], firsts)
+        starts = self.text_start[order].tolist()
+        ends = self.text_end[order].tolist()
+        bounds = firsts.tolist() + [n]
+        buf = self.buffer
+        texts = [
+            "".join([buf[starts[k]:ends[k]] for k in range(a, b)])
+            for a, b in zip(bounds[:-1], bounds[1:])
+        ]
+        return page[firsts], y[firsts], size, bold, texts
+
+
+class ParsedDocument:
+    """
+    A PDF decoded in a single pass over its pages.
+    Holds the span table, the per-page plain text, the embedded outline (if any)
+    and (lazily) the heading tree, so callers that need both structure and text
+    never open the file twice.
+    """
+
+    def __init__(self, pdf_path: Path, max_levels: int = 4):
+        self.path = Path(pdf_path)
+        self.max_levels = max_levels
+        self._tree = None
+        self.first_page = 1
+        with _open(self.path) as doc:
+            self.toc = read_toc(doc)
+            self.page_texts, self.spans = _read_open_pages(doc, self.path.name, 0, None)
+
+    @classmethod
+    def from_parts(cls, pdf_path: Path, parts, max_levels: int = 4, toc=None):
+        """
+        Reassemble a document from read_pages results of consecutive page ranges
+        starting at the first page. toc is read from the file when not given; pass
+        the one read with the first range (with_toc) to avoid opening it again.
+        """
+        doc = cls.__new__(cls)
+        doc.path = Path(pdf_path)
+        doc.max_levels = max_levels
+        doc._tree = None
+        doc.first_page = 1
+        doc.page_texts = [t for page_texts, _ in parts for t in page_texts]
+        doc.spans = SpanTable.concat([spans for _, spans in parts])
+        if toc is None:
+            with _open(doc.path) as pdf:
+                toc = read_toc(pdf)
+        doc.toc = toc
+        return doc
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_texts)
+
+    @property
+    def text(self) -> str:
+        """Full plain text, pages joined by newlines."""
+        return "\n".join(self.page_texts)
+
+    @property
+    def outline_tree(self):
+        if self._tree is None:
+            last_page = self.first_page + self.page_count - 1
+            toc = toc_headings(self.toc, self.first_page, last_page, self.max_levels)
+            if toc is None:
+                self._tree = build_outline_tree(self.spans, self.max_levels, document=self.path.name)
+            else:
+                self._tree = build_toc_tree(toc, self.spans, self.max_levels, document=self.path.name)
+        return self._tree
+
+    @property
+    def outline_source(self) -> str:
+        """"toc" when the heading tree comes from the embedded outline, else "heuristic"."""
+        return outline_source(self.outline_tree)
+
+
+def _decode_page(page, page_index, sizes, bolds, pages, ys, texts) -> str:
+    """Append the spans of one page to the column lists; returns the page's plain text."""
+    blocks = page.get_text("dict").get("blocks", [])
+    page_lines = []
+    for block in blocks:
+        for line in block.get("lines", []):
+            line_start = len(texts)
+            for span in line.get("spans", []):
+                texts.append(span.get("text", ""))
+                sizes.append(round(span.get("size", 0), 1))
+                # Extract bold flag from span flags
+                bolds.append(bool(span.get("flags", 0) & 4))
+                pages.append(page_index)
+                ys.append(round(span.get("bbox", [0,0,0,0])[1], 1))
+            page_lines.append("".join(texts[line_start:]) + "\n")
+    return "".join(page_lines)
+
+
+def _open(pdf_path):
+    with tracing.span("pdf.open", document=Path(pdf_path).name):
+        return fitz.open(pdf_path)
+
+
+def read_pages(pdf_path: Path, start: int = 0, stop=None, with_toc=False):
+    """
+    Decode pages [start, stop) (0-based) of a PDF in one pass.
+    Returns (page_texts, SpanTable); span page numbers are 1-based document pages.
+    With with_toc, returns (page_texts, SpanTable, toc) with read_toc from the same open.
+    """
+    with _open(pdf_path) as doc:
+        part = _read_open_pages(doc, Path(pdf_path).name, start, stop)
+        return (*part, read_toc(doc)) if with_toc else part
+
+
+def _read_open_pages(doc, document, start, stop):
+    page_texts = []
+    sizes, bolds, pages, ys, texts = [], [], [], [], []
+    with tracing.span("pdf.page_text", document=document, start=start) as stage:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        stage.set(stop=stop)
+        for page_index in range(start + 1, stop + 1):
+            page_texts.append(_decode_page(doc[page_index - 1], page_index, sizes, bolds, pages, ys, texts))
+    return page_texts, SpanTable(sizes, bolds, pages, ys, texts)
+
+
+def read_toc(doc):
+    """
+    The embedded outline of an open document as (level, title, page, y) tuples
+    (1-based page, y of the bookmark target or None); empty when OUTLINE_USE_TOC is off.
+    """
+    if not OUTLINE_USE_TOC:
+        return []
+    toc = []
+    for item in doc.get_toc(simple=False):
+        dest = item[3] if len(item) > 3 and isinstance(item[3], dict) else {}
+        to = dest.get("to")
+        toc.append((item[0], item[1], item[2], round(to.y, 1) if to is not None else None))
+    return toc
+
+
+def toc_headings(toc, first_page, last_page, max_levels=4):
+    """
+    Heading candidates ({text, level, page, y, source}) from read_toc entries, or None
+    when the outline is missing or implausible: fewer than two usable entries, most
+    entries unusable (empty, overlong, or pointing outside the pages), or pages that
+    mostly do not increase in outline order. Levels deeper than max_levels are clamped.
+    """
+    headings = []
+    for level, title, page, y in toc:
+        text = clean_text(title)
+        if not text or len(text) > 150 or not first_page <= page <= last_page:
+            continue
+        headings.append({"text": text, "level": min(max(level, 1), max_levels), "page": page,
+                         "y": y if y is not None else 0.0, "source": "toc"})
+    if len(headings) < 2 or len(headings) < len(toc) / 2:
+        return None
+    in_order = sum(a["page"] <= b["page"] for a, b in zip(headings, headings[1:]))
+    if in_order < 0.9 * (len(headings) - 1):
+        return None
+    return headings
+
+
+def _select_lines(lines, mask):
+    pages, ys, sizes, bolds, texts = lines
+    return pages[mask], ys[mask], sizes[mask], bolds[mask], [t for t, keep in zip(texts, mask.tolist()) if keep]
+
+
+def build_toc_tree(headings, spans, max_levels: int = 4, document=None):
+    """
+    Heading tree from toc_headings, with each heading moved onto the line that shows
+    it (so section bodies start below it). Pages before the first bookmark, such as a
+    cover or front matter, are classified with the span heuristics.
+    """
+    builder = OutlineBuilder(max_levels)
+    with tracing.span("outline.group_lines", document=document):
+        lines = spans.group_lines()
+    with tracing.span("outline.toc", document=document, headings=len(headings)):
+        front = lines[0] < headings[0]["page"]
+        if front.any():
+            for candidate in _heading_candidates(_select_lines(lines, front)):
+                builder.add(candidate)
+        for heading in _snap_headings(headings, lines):
+            builder.add(heading)
+    return builder.tree
+
+
+def _snap_headings(headings, lines):
+    """headings with y moved onto the line of lines (group_lines output) that shows each title."""
+    pages, ys, _, _, raw_texts = lines
+    page_list, y_list = pages.tolist(), ys.tolist()
+    return [dict(heading, y=_heading_y(heading, page_list, y_list, raw_texts)) for heading in headings]
+
+
+def _heading_y(heading, pages, ys, raw_texts):
+    """y of the line on the heading's page that starts its title, nearest the bookmark target."""
+    title = heading["text"].lower()
+    best = None
+    start = bisect.bisect_left(pages, heading["page"])
+    stop = bisect.bisect_right(pages, heading["page"])
+    for i in range(start, stop):
+        text = clean_text(raw_texts[i]).lower()
+        if text and (title.startswith(text) or text.startswith(title)):
+            if best is None or abs(ys[i] - heading["y"]) < abs(best - heading["y"]):
+                best = ys[i]
+    return heading["y"] if best is None else best
+
+
+def outline_source(tree) -> str:
+    """"toc" if any heading of the tree came from the embedded outline, else "heuristic"."""
+    return "toc" if any(node.get("source") == "toc" for node in tree) else "heuristic"
+
+
+def iter_pages(pdf_path: Path, start: int = 0, stop=None):
+    """
+    Decode pages [start, stop) (0-based) one at a time, yielding
+    (page_number, page_text, SpanTable) with 1-based page numbers. Only the current
+    page is held in memory; closing the generator early closes the document.
+    """
+    with _open(pdf_path) as doc:
+        yield from _iter_open_pages(doc, Path(pdf_path).name, range(start + 1, _stop(doc, stop) + 1))
+
+
+def _stop(doc, stop):
+    return doc.page_count if stop is None else min(stop, doc.page_count)
+
+
+def _iter_open_pages(doc, document, page_numbers):
+    for page_index in page_numbers:
+        sizes, bolds, pages, ys, texts = [], [], [], [], []
+        with tracing.span("pdf.page_text", document=document, start=page_index - 1, stop=page_index):
+            page_text = _decode_page(doc[page_index - 1], page_index, sizes, bolds, pages, ys, texts)
+        yield page_index, page_text, SpanTable(sizes, bolds, pages, ys, texts)
+
+
+def pdf_page_count(pdf_path: Path) -> int:
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def extract_outline_tree(pdf_path: Path, pdf_dir: Path = None, max_levels: int = 4, page_range=None,
+                         max_sections=OUTLINE_MAX_SECTIONS):
     """
-    Extracts a nested heading tree from the PDF based on standard heading sizes.
+    Extracts a nested heading tree from the PDF: from its embedded outline when it has a
+    plausible one (see toc_headings), otherwise based on standard heading sizes.
+    Returns list of nodes: {level:int, text:str, page:int, source:str, children:list}.
+
+    Pages are streamed one at a time from a single open, so memory does not grow with
+    document length. With a bookmark outline only the pages before the first bookmark
+    (classified with the span heuristics) and the pages bookmarks point to (to place
+    each heading on its line, as build_toc_tree does) are decoded. page_range=(start,
+    stop) limits the pages read, and max_sections stops the heuristic scan once that
+    many headings were found. Without either, the tree equals ParsedDocument's.
+    pdf_dir is accepted for compatibility and unused.
+    """
+    start, stop = page_range or (0, None)
+    document = Path(pdf_path).name
+    builder = OutlineBuilder(max_levels)
+    with _open(pdf_path) as doc:
+        stop = _stop(doc, stop)
+        toc = toc_headings(read_toc(doc), start + 1, stop, max_levels)
+        # Bookmarked document: only the front matter is classified from its spans
+        scan_stop = stop if toc is None else min(stop, toc[0]["page"] - 1)
+        pages = _iter_open_pages(doc, document, range(start + 1, scan_stop + 1))
+        try:
+            for _, _, spans in pages:
+                builder.add_page(spans, document=document)
+                if max_sections and builder.count >= max_sections:
+                    break
+        finally:
+            pages.close()
+        if toc is not None:
+            with tracing.span("outline.toc", document=document, headings=len(toc)):
+                on_page = {}
+                for i, heading in enumerate(toc):
+                    on_page.setdefault(heading["page"], []).append(i)
+                for page, _, spans in _iter_open_pages(doc, document, sorted(on_page)):
+                    lines = spans.group_lines()
+                    for i in on_page[page]:
+                        toc[i] = _snap_headings([toc[i]], lines)[0]
+                for heading in toc:
+                    builder.add(heading)
+    return builder.tree
+
+
+class OutlineBuilder:
+    """
+    The heading state machine, fed in page order. Paragraphs never span pages, so
+    classifying page by page gives the same tree as build_outline_tree on the whole
+    document.
+    """
+
+    def __init__(self, max_levels: int = 4):
+        self.max_levels = max_levels
+        self.tree = []
+        self.count = 0
+        self._stack = []
+
+    def add_page(self, spans, document=None):
+        """Classify the lines of a SpanTable (one or more consecutive pages) and nest its headings."""
+        with tracing.span("outline.group_lines", document=document):
+            lines = spans.group_lines()
+        with tracing.span("outline.classify", document=document):
+            for candidate in _heading_candidates(lines):
+                self.add(candidate)
+
+    def add(self, candidate):
+        lvl = candidate["level"]
+        node = {"level": lvl, "text": candidate["text"], "page": candidate["page"], "y": candidate["y"],
+                "source": candidate.get("source", "heuristic"), "children": []}
+        while self._stack and self._stack[-1]["level"] >= lvl:
+            self._stack.pop()
+        if self._stack:
+            self._stack[-1]["children"].append(node)
+        else:
+            self.tree.append(node)
+        self._stack.append(node)
+        self.count += 1
+
+
+def build_outline_tree(spans, max_levels: int = 4, document=None):
+    """
+    Builds the heading tree from a SpanTable as produced by ParsedDocument.
     Returns list of nodes: {level:int, text:str, page:int, children:list}.
+    document only labels the trace spans.
     """
+    builder = OutlineBuilder(max_levels)
+    builder.add_page(spans, document=document)
+    return builder.tree
+
+
+def _heading_candidates(lines):
+    """Heading candidates ({text, level, page, y}, in reading order) among grouped lines."""
     # Updated standard heading sizes based on typography standards
     standard_heading_sizes = {
         1: (18, 36),  # H1: 18-36 points
@@ -60,116 +460,72 @@ def extract_outline_tree(pdf_path: Path, pdf_dir: Path, max_levels: int = 4):
     }
     body_text_range = (10, 12)  # Body text: 10-12 points
     
-    spans = []
-    with fitz.open(pdf_path) as doc:
-        for page_index, page in enumerate(doc, start=1):
-            blocks = page.get_text("dict").get("blocks", [])
-            for block in blocks:
-                for line in block.get("lines", []):
-                    for span in line.get("spans", []):
-                        # Extract bold flag from span flags
-                        bold = bool(span.get("flags", 0) & 4)
-                        spans.append({
-                            "text": span.get("text", ""),
-                            "size": round(span.get("size", 0), 1),
-                            "page": page_index,
-                            "y": round(span.get("bbox", [0,0,0,0])[1], 1),
-                            "bold": bold
-                        })
-    
-    # Group spans into lines with additional metadata
-    lines = defaultdict(lambda: {"text": [], "size": 0, "bold": False})
-    for sp in spans:
-        key = (sp["page"], sp["y"])
-        lines[key]["text"].append(sp["text"])
-        if sp["size"] > lines[key]["size"]:
-            lines[key]["size"] = sp["size"]
-        if sp.get("bold"):
-            lines[key]["bold"] = True
-
-    # Create paragraphs with enhanced metadata
-    paragraphs = []
-    for (page, y), info in lines.items():
-        text = clean_text("".join(info["text"]))
-        if text:
-            paragraphs.append({
-                "text": text, 
-                "size": info["size"], 
-                "bold": info["bold"],
-                "page": page, 
-                "y": y
-            })
-
-    if not paragraphs:
+    # Lines with additional metadata, as grouped by SpanTable.group_lines
+    pages, ys, sizes, bolds, raw_texts = lines
+    texts = [clean_text(t) for t in raw_texts]
+    keep = np.fromiter(map(bool, texts), dtype=bool, count=len(texts))
+    if not keep.any():
         return []
+    texts = [t for t in texts if t]
+    pages, ys, sizes, bolds = pages[keep], ys[keep], sizes[keep], bolds[keep]
 
     # Universal fragment merging for all PDFs (not just file04)
-    # Sort paragraphs by page and position
-    sorted_paragraphs = sorted(paragraphs, key=lambda x: (x["page"], x["y"]))
-    merged_paragraphs = []
-    current_paragraph = None
-    
-    for p in sorted_paragraphs:
-        # Start a new paragraph if:
-        # 1. This is the first paragraph
-        # 2. Current text ends with a period, colon, or bullet
-        # 3. This text starts with a capital letter, number, or bullet
-        # 4. This is on a different page
-        # 5. Font size or formatting is significantly different
-        if (current_paragraph is None or
-            current_paragraph["text"].endswith(('.', ':', '•', '-', '?', '!')) or
-            (p["text"] and (p["text"][0].isupper() or p["text"][0].isdigit() or p["text"].startswith(('•', '-')))) or
-            p["page"] != current_paragraph["page"] or
-            abs(p["size"] - current_paragraph["size"]) > 1 or
-            p["bold"] != current_paragraph["bold"]):
-            
-            if current_paragraph:
-                merged_paragraphs.append(current_paragraph)
-            current_paragraph = p.copy()
+    # Lines are already in page and position order. Start a new paragraph if:
+    # 1. This is the first line
+    # 2. Previous text ends with a period, colon, or bullet
+    # 3. This text starts with a capital letter, number, or bullet
+    # 4. This is on a different page
+    # 5. Font size or formatting is significantly different
+    # 2 and 3 only depend on neighbouring lines, so they are computed up front.
+    ends_clause = np.fromiter((t.endswith(('.', ':', '•', '-', '?', '!')) for t in texts), dtype=bool, count=len(texts))
+    starts_new = np.fromiter(
+        (t[0].isupper() or t[0].isdigit() or t.startswith(('•', '-')) for t in texts), dtype=bool, count=len(texts)
+    )
+    forced = starts_new
+    forced[0] = True
+    forced[1:] |= ends_clause[:-1]
+
+    page_list, size_list, bold_list = pages.tolist(), sizes.tolist(), bolds.tolist()
+    para_first = []
+    para_parts = []
+    first = 0
+    for i, is_forced in enumerate(forced.tolist()):
+        if (is_forced or
+            page_list[i] != page_list[first] or
+            abs(size_list[i] - size_list[first]) > 1 or
+            bold_list[i] != bold_list[first]):
+            first = i
+            para_first.append(i)
+            para_parts.append([texts[i]])
         else:
             # Merge with current paragraph
-            current_paragraph["text"] += " " + p["text"]
-    
-    if current_paragraph:
-        merged_paragraphs.append(current_paragraph)
-    
-    paragraphs = merged_paragraphs
+            para_parts[-1].append(texts[i])
+    para_text = [" ".join(parts) for parts in para_parts]
+    para_first = np.asarray(para_first, dtype=np.int64)
+    para_size = sizes[para_first]
+    para_bold = bolds[para_first]
 
     # Classify headings based on standard size ranges and formatting
+    # (the first matching band wins, then bold text above body size is H4)
+    conditions = [(min_size <= para_size) & (para_size <= max_size)
+                  for min_size, max_size in standard_heading_sizes.values()]
+    conditions.append(para_bold & (para_size > body_text_range[1]))
+    para_level = np.select(conditions, list(standard_heading_sizes.keys()) + [4], default=0)
+    # Cheap length bounds from is_semantic_heading, before the per-text checks
+    para_len = np.fromiter(map(len, para_text), dtype=np.int64, count=len(para_text))
+    maybe = (para_level >= 1) & (para_level <= 4) & (para_len >= 8) & (para_len <= 80)
+
     candidates = []
-    for p in paragraphs:
-        if not is_semantic_heading(p["text"]):
-            continue
-        font_size = p["size"]
-        is_bold = p["bold"]
-        heading_level = None
-        for level, (min_size, max_size) in standard_heading_sizes.items():
-            if min_size <= font_size <= max_size:
-                heading_level = level
-                break
-        if heading_level is None and is_bold and font_size > body_text_range[1]:
-            heading_level = 4
-        if heading_level is not None and 1 <= heading_level <= 4:
-            p["level"] = heading_level
-            candidates.append(p)
-    
-    # Sort by page and position
-    candidates.sort(key=lambda p: (p["page"], p["y"]))
-    
-    # Build nested heading tree
-    tree = []
-    stack = []
-    for p in candidates:
-        lvl = p["level"]
-        node = {"level": lvl, "text": p["text"], "page": p["page"], "children": []}
-        while stack and stack[-1]["level"] >= lvl:
-            stack.pop()
-        if stack:
-            stack[-1]["children"].append(node)
-        else:
-            tree.append(node)
-        stack.append(node)
-    return tree
+    for j in np.flatnonzero(maybe).tolist():
+        if is_semantic_heading(para_text[j]):
+            i = para_first[j]
+            candidates.append({
+                "text": para_text[j],
+                "level": int(para_level[j]),
+                "page": page_list[i],
+                "y": ys[i].item(),
+            })
+    return candidates
 
 
 def is_semantic_heading(text: str) -> bool:
@@ -222,14 +578,20 @@ def is_valid_title(text: str) -> bool:
     return True
 
 
-def flatten_outline(tree, title_text=None):
-    """Flatten nested tree into list, skipping duplicate title."""
+def flatten_outline(tree, title_text=None, with_position=False):
+    """
+    Flatten nested tree into list, skipping duplicate title.
+    with_position keeps each heading's y coordinate so its body can be segmented later.
+    """
     flat = []
     for n in tree:
         if not (title_text and n["text"] == title_text and n["level"] == 1):
-            flat.append({"level": f"H{n['level']}", "text": n["text"], "page": n["page"]})
+            item = {"level": f"H{n['level']}", "text": n["text"], "page": n["page"]}
+            if with_position:
+                item["y"] = n.get("y", 0)
+            flat.append(item)
         if n.get("children"):
-            flat.extend(flatten_outline(n["children"], title_text))
+            flat.extend(flatten_outline(n["children"], title_text, with_position))
     return flat
 
 
@@ -251,32 +613,72 @@ def flatten_outline_to_sections(outline, min_level=1, max_level=2):
     return sections
 
 
-def generate_outline_json(pdf_path: Path, output_path: Path):
-    pdf_dir = pdf_path.parent
-    tree = extract_outline_tree(pdf_path, pdf_dir)
+def outline_json(tree):
+    """The {title, outline} result for a heading tree."""
     first_h1 = next((n for n in tree if n["level"] == 1), None)
     second_h2 = next((n for n in tree if n["level"] == 2 and n != first_h1), None)
     title = first_h1["text"] if first_h1 else second_h2["text"] if second_h2 else ""
     outline = flatten_outline(tree, title_text=title)
-    result = {"title": title, "outline": outline}
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(result, f, indent=2, ensure_ascii=False)
+    return {"title": title, "outline": outline}
+
+
+def write_outline_json(tree, output_path: Path):
+    with tracing.span("output.write", document=Path(output_path).name), \
+            open(output_path, "w", encoding="utf-8") as f:
+        json.dump(outline_json(tree), f, indent=2, ensure_ascii=False)
+
+
+def generate_outline_json(pdf_path: Path, output_path: Path):
+    write_outline_json(extract_outline_tree(pdf_path), output_path)
 
 
 def main():
-    input_dir = Path("input")
-    output_dir = Path("output")
+    import argparse
+    # Imported here: extraction_pool and outline_watch build on this module
+    from extraction_pool import EXTRACT_WORKERS, ExtractionPool
+    from outline_watch import WATCH_DEBOUNCE, run_incremental, watch
+
+    parser = argparse.ArgumentParser(description="Extract PDF outlines to JSON.")
+    parser.add_argument("--input", default="input", help="directory of PDFs (default: input)")
+    parser.add_argument("--output", default="output", help="directory for the JSON outlines (default: output)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only extract new or changed PDFs and remove outputs of deleted ones")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and sync incrementally whenever the input directory changes")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE,
+                        help="seconds of quiet after a change before syncing (watch mode)")
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="extraction processes")
+    parser.add_argument("--max-sections", type=int, default=OUTLINE_MAX_SECTIONS,
+                        help="stop reading a PDF once this many headings were found (default: read every page)")
+    args = parser.parse_args()
+
+    input_dir = Path(args.input)
+    output_dir = Path(args.output)
     input_dir.mkdir(exist_ok=True)
     output_dir.mkdir(exist_ok=True)
 
+    if args.watch or args.incremental:
+        with ExtractionPool(workers=args.workers, outline_only=True, max_sections=args.max_sections) as pool:
+            if args.watch:
+                watch(input_dir, output_dir, pool, debounce=args.debounce)
+            else:
+                run_incremental(input_dir, output_dir, pool)
+        return
+
     pdf_files = list(input_dir.glob("*.pdf"))
     if not pdf_files:
         print(f"No PDFs in {input_dir.resolve()}. Place files there.")
         return
-    for pdf in pdf_files:
-        out_file = output_dir / f"{pdf.stem}.json"
-        print(f"Processing {pdf.name} -> {out_file.name}")
-        generate_outline_json(pdf, out_file)
+    # Stream each PDF's pages on all cores; each output is written as soon as its PDF is done
+    with tracing.profiled(), ExtractionPool(workers=args.workers, outline_only=True,
+                                            max_sections=args.max_sections) as pool:
+        for pdf, entry in pool.iter_completed(pdf_files):
+            out_file = output_dir / f"{pdf.stem}.json"
+            print(f"Processing {pdf.name} -> {out_file.name}")
+            write_outline_json(entry["tree"], out_file)
+    print(pool.summary())
+    if tracing.write_trace():
+        print(f"Trace written to {tracing.TRACE_PATH}:\n{tracing.summary()}")
     print("Done.")
 
 if __name__ == "__main__":
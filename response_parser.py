@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Incremental decoding of the model's {idx, summary} items.
+
+The parser is fed response text chunk by chunk as it streams in and emits each
+item as soon as its closing brace arrives, so finished items survive even if
+the generation is later cut off. Objects are decoded as JSON, then as Python
+literals, then with a regex repair that tolerates unescaped apostrophes in
+single-quoted summaries. Only items carrying an "idx" are kept; the first
+answer for an index wins.
+"""
+
+import ast
+import json
+import re
+
+# JSON schema for Ollama's structured-output "format" option
+ITEMS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"idx": {"type": "integer"}, "summary": {"type": "string"}},
+        "required": ["idx", "summary"],
+    },
+}
+
+_ITEM_RE = re.compile(
+    r"""["']idx["']\s*:\s*["']?(\d+)["']?\s*,\s*["']summary["']\s*:\s*(["'])(.*?)\2\s*\}""",
+    re.DOTALL,
+)
+
+
+def _normalize(item):
+    if not isinstance(item, dict) or "idx" not in item:
+        return None
+    idx = item["idx"]
+    if isinstance(idx, str) and idx.strip().isdigit():
+        idx = int(idx)
+    if not isinstance(idx, int):
+        return None
+    summary = item.get("summary", "")
+    return {"idx": idx, "summary": summary if isinstance(summary, str) else str(summary)}
+
+
+def decode_object(text):
+    """Decode one {...} object; None if it is not a usable item."""
+    for decode in (json.loads, ast.literal_eval):
+        try:
+            return _normalize(decode(text))
+        except Exception:
+            continue
+    match = _ITEM_RE.search(text)
+    if match:
+        return {"idx": int(match.group(1)), "summary": match.group(3)}
+    return None
+
+
+class StreamingItemParser:
+    def __init__(self, on_item=None):
+        self.on_item = on_item
+        self.items = {}
+        self._text = ""
+        self._pos = 0
+        self._starts = []
+        self._quote = None
+        self._escaped = False
+
+    def _add(self, item):
+        if item is not None and item["idx"] not in self.items:
+            self.items[item["idx"]] = item
+            if self.on_item is not None:
+                self.on_item(item)
+
+    def feed(self, chunk: str):
+        """Consume the next piece of response text."""
+        self._text += chunk
+        text = self._text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._quote:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == self._quote:
+                    self._quote = None
+            elif c in "\"'":
+                self._quote = c
+            elif c == "{":
+                self._starts.append(i)
+            elif c == "}" and self._starts:
+                self._add(decode_object(text[self._starts.pop():i + 1]))
+        self._pos = len(text)
+
+    def finish(self, full_text=None):
+        """
+        Items found, in index order. full_text is the complete response; it is fed if
+        no chunks were (e.g. a cached response) and scanned once more with the repair
+        pattern for items the brace scanner could not delimit.
+        """
+        if full_text is not None and not self._text:
+            self.feed(full_text)
+        text = self._text or full_text or ""
+        for match in _ITEM_RE.finditer(text):
+            self._add({"idx": int(match.group(1)), "summary": match.group(3)})
+        return [self.items[idx] for idx in sorted(self.items)]
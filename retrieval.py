@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Section retrieval for a document collection.
+
+Every candidate section (heading plus body text) is indexed once per run; the
+persona and job-to-be-done form the query and only the best-scoring sections
+go on to summarization. Sections are scored by cosine similarity of Ollama
+embeddings when EMBED_MODEL is set and the server answers, and by BM25 over
+the section text otherwise, so the ranking also works CPU-only without an
+embedding model.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+
+import requests
+
+from ollama_client import OLLAMA_URL, log
+
+EMBED_MODEL = os.environ.get("EMBED_MODEL", "")  # e.g. "nomic-embed-text"; empty = BM25 only
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "10"))
+# Body text indexed per section
+INDEX_TOKEN_BUDGET = int(os.environ.get("INDEX_TOKEN_BUDGET", "512"))
+# Upper bound on the body text sent to the model for each section
+EXCERPT_TOKEN_BUDGET = int(os.environ.get("EXCERPT_TOKEN_BUDGET", "120"))
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it its of on or our that the their "
+    "this to was we were will with you your".split()
+)
+
+
+def tokenize(text: str):
+    return [w for w in re.findall(r'\w+', text.lower()) if w not in STOPWORDS]
+
+
+def section_document(section) -> str:
+    """The text a section is indexed by: its heading followed by its body."""
+    return f"{section.get('text', '')}\n{section.get('body', '')}"
+
+
+class BM25Index:
+    """Okapi BM25 over tokenized documents (or precomputed term-frequency Counters)."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [d if isinstance(d, Counter) else Counter(tokenize(d)) for d in documents]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        doc_freq = Counter()
+        for tf in self.term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(self.term_freqs)
+        self.idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in doc_freq.items()}
+
+    def scores(self, query: str):
+        terms = [t for t in set(tokenize(query)) if t in self.idf]
+        result = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            score = 0.0
+            for t in terms:
+                f = tf.get(t, 0)
+                if f:
+                    score += self.idf[t] * f * (self.k1 + 1) / (f + norm)
+            result.append(score)
+        return result
+
+
+def embed_texts(texts, model=EMBED_MODEL, url=OLLAMA_URL, timeout=120):
+    """Embeddings from Ollama's /api/embed endpoint, one vector per text."""
+    embed_url = url.rsplit("/api/", 1)[0] + "/api/embed"
+    response = requests.post(embed_url, json={"model": model, "input": list(texts)}, timeout=timeout)
+    response.raise_for_status()
+    return response.json()["embeddings"]
+
+
+def cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+class SectionIndex:
+    """
+    Retrieval index over sections ({document, text, page, body, ...} dicts).
+    Uses embeddings when an embedding model is configured and reachable, BM25 otherwise.
+
+    Sections can be added in several calls (e.g. one per document as parsing
+    finishes); term statistics are only combined when searching.
+    """
+
+    def __init__(self, sections=(), embed_model=EMBED_MODEL):
+        self.embed_model = embed_model
+        self.kind = "embedding" if embed_model else "bm25"
+        self.sections = []
+        self._term_freqs = []
+        self._vectors = []
+        self.add(sections)
+
+    def __len__(self):
+        return len(self.sections)
+
+    def add(self, sections):
+        sections = list(sections)
+        if not sections:
+            return
+        documents = [section_document(s) for s in sections]
+        self.sections.extend(sections)
+        # Term frequencies are always kept so BM25 remains available as a fallback
+        self._term_freqs.extend(Counter(tokenize(d)) for d in documents)
+        if self.kind == "embedding":
+            try:
+                self._vectors.extend(embed_texts(documents, self.embed_model))
+            except Exception as e:
+                self._fall_back(e)
+
+    def _fall_back(self, error):
+        log(f"Embedding index unavailable ({error}); falling back to BM25")
+        self.kind = "bm25"
+        self._vectors = []
+
+    def scores(self, query: str):
+        if self.kind == "embedding":
+            try:
+                q = embed_texts([query], self.embed_model)[0]
+                return [cosine(q, v) for v in self._vectors]
+            except Exception as e:
+                self._fall_back(e)
+        return BM25Index(self._term_freqs).scores(query)
+
+    def search(self, query: str, k=RETRIEVAL_TOP_K):
+        """Top-k (score, section) pairs, best first."""
+        if not self.sections:
+            return []
+        scores = self.scores(query)
+        order = sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+        return [(scores[i], self.sections[i]) for i in order[:k]]
+
+
+def build_query(persona: str, job_to_be_done: str) -> str:
+    return f"{persona}. {job_to_be_done}"
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Append-only JSONL journal of a collection run.
+
+Every finished batch and document is appended (and flushed to disk) as soon as
+it completes, so a crash or timeout loses at most the work in flight. The
+final challenge1b_output.json is assembled from the journal's document
+records. With resume=True, an existing journal for the same run (same input,
+persona and job) is loaded and its finished documents and batches are skipped.
+Documents marked "degraded" (some sections summarized extractively because
+their model calls failed or a deadline ran out) are not taken over by a resumed run, so their sections go to the model
+again; the model batches they did finish are still reused.
+
+Record types:
+    {"type": "run", "run": {...}}
+    {"type": "batch", "document": ..., "key": ..., "response": ..., "results": [...]}
+    {"type": "document", "document": ..., "extracted_sections": [...], "subsection_analysis": [...],
+     "degraded": true}  (degraded only when set)
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+
+def journal_path(output_json_path) -> Path:
+    output_json_path = Path(output_json_path)
+    return output_json_path.with_name(output_json_path.stem + ".journal.jsonl")
+
+
+def batch_key(pdf_name, batch) -> str:
+    """Identity of a batch: its document and the (heading, page) of each section in it."""
+    ident = json.dumps([pdf_name, [[info["heading"], info["page"]] for info in batch]], ensure_ascii=False)
+    return hashlib.sha256(ident.encode("utf-8")).hexdigest()[:16]
+
+
+class RunJournal:
+    def __init__(self, path, run_info, resume=False):
+        self.path = Path(path)
+        self.run_info = run_info
+        self.batches = {}
+        self.documents = {}
+        self._lock = threading.Lock()
+        if resume and self._load():
+            mode = "a"
+        else:
+            mode = "w"
+            self.batches.clear()
+            self.documents.clear()
+        self._file = open(self.path, mode, encoding="utf-8")
+        if mode == "w":
+            self._append({"type": "run", "run": run_info})
+
+    def _load(self) -> bool:
+        """Read an existing journal; False if there is none or it belongs to another run."""
+        if not self.path.exists():
+            return False
+        has_run = False
+        with open(self.path, encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    if i == 0:
+                        # No readable run record, so nothing says the journal is this run's
+                        return False
+                    # A torn last line from a crash mid-write
+                    continue
+                if i == 0:
+                    if record.get("type") != "run" or record.get("run") != self.run_info:
+                        return False
+                    has_run = True
+                elif record.get("type") == "batch":
+                    self.batches[record["key"]] = record
+                elif record.get("type") == "document" and not record.get("degraded"):
+                    self.documents[record["document"]] = record
+        # An empty journal has no run record either
+        return has_run
+
+    def _append(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def batch(self, key):
+        """The recorded batch for key, or None."""
+        return self.batches.get(key)
+
+    def record_batch(self, document, key, response, results):
+        record = {"type": "batch", "document": document, "key": key, "response": response, "results": results}
+        self.batches[key] = record
+        self._append(record)
+
+    def document(self, document):
+        """The recorded final result of a document, or None."""
+        return self.documents.get(document)
+
+    def record_document(self, document, result, degraded=False):
+        """Record a document's final result; degraded ones are redone by a resumed run."""
+        record = {"type": "document", "document": document,
+                  "extracted_sections": result.get("extracted_sections", []),
+                  "subsection_analysis": result.get("subsection_analysis", [])}
+        if degraded:
+            record["degraded"] = True
+        self.documents[document] = record
+        self._append(record)
+
+    def assemble(self):
+        """(extracted_sections, subsection_analysis) of all finished documents, best rank first."""
+        pairs = []
+        for record in self.documents.values():
+            pairs.extend(zip(record["extracted_sections"], record["subsection_analysis"]))
+        pairs.sort(key=lambda p: p[0]["importance_rank"])
+        return [p[0] for p in pairs], [p[1] for p in pairs]
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Section body segmentation for parsed PDFs.
+
+Each heading in the outline tree carries the (page, y) of its first line. A
+section's body is every text line after that position up to the next heading
+at the same or a higher level (or the end of the document). Bodies are only
+assembled when asked for, and can be capped at a token budget.
+"""
+
+import bisect
+
+from process_pdfs import clean_text
+
+
+def section_key(section) -> str:
+    """Stable key for a heading: its page and y coordinate."""
+    return f"{section['page']}:{section.get('y', 0)}"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, token_budget: int) -> str:
+    """Cut text to roughly token_budget tokens, on a word boundary."""
+    max_chars = token_budget * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    return cut[:space] if space > 0 else cut
+
+
+class SectionSegmenter:
+    """
+    Maps headings of a ParsedDocument to their body text.
+
+    Accepts both tree nodes ({level:int, ...}) and flattened sections
+    ({level:"H2", ...}, from flatten_outline(..., with_position=True)).
+    """
+
+    def __init__(self, doc):
+        # Positioned lines, grouped the same way the outline builder does
+        pages, ys, _, _, raw_texts = doc.spans.group_lines()
+        self._keys = list(zip(pages.tolist(), ys.tolist()))
+        self._texts = [clean_text(t) for t in raw_texts]
+        # Where each heading's body stops: next heading at the same or higher level
+        self._ends = {}
+        headings = []
+        self._walk(doc.outline_tree, headings)
+        stack = []
+        for node in headings:
+            key = (node["page"], node.get("y", 0))
+            while stack and stack[-1][0] >= node["level"]:
+                _, open_key = stack.pop()
+                self._ends[open_key] = key
+            stack.append((node["level"], key))
+
+    def _walk(self, nodes, out):
+        for node in nodes:
+            out.append(node)
+            self._walk(node.get("children", []), out)
+
+    @property
+    def lines(self):
+        """All positioned lines of the document, in reading order."""
+        return self._texts
+
+    def line_range(self, section):
+        """Index range [start, stop) into lines holding the body of a section."""
+        start = (section["page"], section.get("y", 0))
+        end = self._ends.get(start)
+        i = bisect.bisect_right(self._keys, start)
+        stop = bisect.bisect_left(self._keys, end) if end else len(self._keys)
+        heading = section.get("text", "")
+        # Headings merged from several lines: skip their continuation lines
+        while i < stop and self._texts[i] and self._texts[i] in heading:
+            i += 1
+        return i, stop
+
+    def iter_lines(self, section):
+        """Yield the body lines of a section, in reading order."""
+        start, stop = self.line_range(section)
+        for j in range(start, stop):
+            if self._texts[j]:
+                yield self._texts[j]
+
+    def body(self, section, token_budget=None) -> str:
+        """Body text of a section, optionally capped at token_budget tokens."""
+        return join_lines(self.iter_lines(section), token_budget)
+
+    def iter_bodies(self, sections, token_budget=None):
+        """Lazily yield (section, body) pairs."""
+        for section in sections:
+            yield section, self.body(section, token_budget)
+
+
+def join_lines(lines, token_budget=None) -> str:
+    """Join body lines, consuming only as many as the token budget needs."""
+    parts = []
+    used = 0
+    for line in lines:
+        if not line:
+            continue
+        parts.append(line)
+        used += estimate_tokens(line) + 1
+        if token_budget is not None and used >= token_budget:
+            break
+    text = " ".join(parts)
+    return truncate_to_tokens(text, token_budget) if token_budget is not None else text
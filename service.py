@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Long-running analysis service.
+
+Keeps everything a batch run pays for on every start warm: the interpreter and
+PyMuPDF, the extraction process pool, the parse cache, the collection indexes
+and the LLM backend (with its connection pool or loaded local model). Jobs are
+challenge1b_input.json documents plus the collection they refer to; they are
+queued and run SERVICE_JOBS at a time. A job submitted while an identical one
+(same PDFs, persona, job and options) is queued or running is answered with
+that job instead of running twice, and jobs over the same collection index it
+one at a time, so its PDFs are parsed at most once.
+
+Endpoints:
+    POST /jobs               submit {"collection": "Collection 1", ...challenge1b_input.json...}
+                             optional "pdf_dir", "top_k", "llm_sections", "deadline" (seconds from
+                             submission); answers {"id", "status", ...}
+    GET  /jobs/{id}          job status (and its output once done)
+    GET  /jobs/{id}/events   partial results as JSON lines while the job runs: "queued", "started",
+                             "indexed" per parsed PDF, "ranked", "document" per summarized PDF,
+                             "duplicates" (summaries copied to near-duplicate sections), then
+                             "done" (with the output) or "failed"
+    GET  /jobs/{id}/result   the challenge1b_output.json document, waiting for the job if needed
+    GET  /health             queue and backend state (per Ollama endpoint with OLLAMA_URLS)
+
+Usage:
+    python service.py [--host 127.0.0.1] [--port 8080] [--socket /tmp/doc-intel.sock]
+    curl -s localhost:8080/jobs -d @"Collection 1/challenge1b_input.json" ...  (add "collection")
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+from aiohttp import web
+
+import tracing
+from collection_index import CollectionIndex
+from deadline import start_deadline
+from extraction_pool import EXTRACT_WORKERS, ExtractionPool
+from llm_backend import create_backend
+from ollama_client import OLLAMA_MAX_IN_FLIGHT, log
+from ollama_integration import (LLM_SECTIONS, CollectionRun, plan_extraction, prepare_sections,
+                                summarize_collection)
+from parse_cache import ParseCache
+from retrieval import RETRIEVAL_TOP_K
+from run_journal import journal_path
+
+SERVICE_HOST = os.environ.get("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("SERVICE_PORT", "8080"))
+SERVICE_SOCKET = os.environ.get("SERVICE_SOCKET", "")  # Unix socket path; replaces host/port when set
+SERVICE_JOBS = int(os.environ.get("SERVICE_JOBS", "2"))  # jobs run concurrently
+SERVICE_KEEP_JOBS = int(os.environ.get("SERVICE_KEEP_JOBS", "200"))  # finished jobs kept for lookup
+SERVICE_OUTPUT_DIR = os.environ.get("SERVICE_OUTPUT_DIR", str(Path(__file__).parent / ".cache" / "service"))
+SERVICE_ROOT = os.environ.get("SERVICE_ROOT", ".")  # relative collection paths are resolved here
+
+
+class Job:
+    """One submitted analysis: its request, state and the events emitted so far."""
+
+    def __init__(self, job_id, key, run, top_k, llm_sections, deadline=0):
+        self.id = job_id
+        self.key = key
+        self.run = run
+        self.top_k = top_k
+        self.llm_sections = llm_sections
+        self.status = "queued"
+        self.output = None
+        self.error = None
+        self.events = []
+        self.submitted = time.time()
+        self.deadline = start_deadline(deadline)
+        self.timings = {}
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def emit(self, event):
+        """Record an event and wake the streams waiting for one; call on the event loop."""
+        self.events.append({"job": self.id, "at": round(time.time() - self.submitted, 3), **event})
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def events_from(self, start=0):
+        """Yield the job's events from index start, waiting for new ones until it finishes."""
+        while True:
+            changed = self._changed
+            events = self.events[start:]
+            for event in events:
+                yield event
+            start += len(events)
+            if self.finished and start >= len(self.events):
+                return
+            if start >= len(self.events):
+                await changed.wait()
+
+    async def wait(self):
+        while not self.finished:
+            await self._changed.wait()
+
+    def describe(self, with_output=True):
+        info = {"id": self.id, "status": self.status, "collection": self.run.name,
+                "persona": self.run.persona, "job_to_be_done": self.run.job_to_be_done,
+                "events": len(self.events), "timings": self.timings}
+        if self.error:
+            info["error"] = self.error
+        if with_output and self.output is not None:
+            info["output"] = self.output
+        return info
+
+
+def job_key(pdf_dir, input_data, top_k, llm_sections, deadline=0) -> str:
+    """Identity of a job's work, for deduplicating concurrent submissions."""
+    ident = json.dumps([str(Path(pdf_dir).resolve()), input_data.get("documents"), input_data.get("persona"),
+                        input_data.get("job_to_be_done"), top_k, llm_sections, deadline],
+                       sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(ident.encode("utf-8")).hexdigest()
+
+
+class AnalysisService:
+    """
+    Usage:
+        async with AnalysisService() as service:
+            job, deduplicated = service.submit(input_data, "Collection 1")
+            async for event in job.events_from(): ...
+    """
+
+    def __init__(self, workers=SERVICE_JOBS, extract_workers=EXTRACT_WORKERS, max_in_flight=OLLAMA_MAX_IN_FLIGHT,
+                 output_dir=SERVICE_OUTPUT_DIR, root=SERVICE_ROOT):
+        self.workers = workers
+        self.output_dir = Path(output_dir)
+        self.root = Path(root)
+        self.parse_cache = ParseCache()
+        self.pool = ExtractionPool(workers=extract_workers, parse_cache=self.parse_cache)
+        self.client = create_backend(max_in_flight=max_in_flight)
+        self.jobs = {}
+        self.active = {}  # job key -> queued or running job
+        self.stores = {}  # pdf_dir -> CollectionIndex, shared by all jobs on that collection
+        self.collection_locks = {}
+        self.queue = None
+        self._tasks = []
+        self.completed = 0
+
+    async def __aenter__(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.pool.__enter__()
+        await self.client.__aenter__()
+        self.queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        log(f"Service ready: {self.workers} job worker(s), LLM backend '{self.client.name}'")
+        return self
+
+    async def __aexit__(self, *exc):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.client.__aexit__(*exc)
+        self.pool.__exit__(*exc)
+        return False
+
+    def submit(self, input_data, collection=None, pdf_dir=None, top_k=RETRIEVAL_TOP_K, llm_sections=LLM_SECTIONS,
+               deadline=0):
+        """Queue a job, or return the identical job already queued or running; (job, deduplicated)."""
+        if not collection and not pdf_dir:
+            raise ValueError("a job needs a 'collection' directory or a 'pdf_dir'")
+        collection_dir = self.root / (collection or Path(pdf_dir).parent)
+        pdf_dir = self.root / pdf_dir if pdf_dir else collection_dir / "PDFs"
+        if not pdf_dir.is_dir():
+            raise ValueError(f"no PDF directory at {pdf_dir}")
+        if not input_data.get("documents"):
+            raise ValueError("the job lists no documents")
+        key = job_key(pdf_dir, input_data, top_k, llm_sections, deadline)
+        if key in self.active:
+            return self.active[key], True
+
+        store_key = str(pdf_dir.resolve())
+        if store_key not in self.stores:
+            self.stores[store_key] = CollectionIndex(pdf_dir)
+            self.collection_locks[store_key] = asyncio.Lock()
+        job_id = uuid.uuid4().hex[:12]
+        run = CollectionRun(collection_dir / "challenge1b_input.json", pdf_dir, self.output_dir / f"{job_id}.json",
+                            input_data=input_data, store=self.stores[store_key])
+        job = Job(job_id, key, run, top_k, llm_sections, deadline)
+        self.jobs[job.id] = job
+        self.active[key] = job
+        self.queue.put_nowait(job)
+        job.emit({"event": "queued", "position": self.queue.qsize()})
+        self._forget_old_jobs()
+        return job, False
+
+    def _forget_old_jobs(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - SERVICE_KEEP_JOBS)]:
+            del self.jobs[job.id]
+            # The job's output and journal would otherwise pile up in output_dir
+            output = job.run.output_json_path
+            for path in (output, journal_path(output)):
+                path.unlink(missing_ok=True)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self.active.pop(job.key, None)
+                self.queue.task_done()
+
+    def _index(self, job, loop):
+        """Parse the job's new or changed PDFs into the collection index (in a worker thread)."""
+        run = job.run
+        owners = plan_extraction([run])
+        for pdf_path, parsed in (self.pool.iter_completed(owners) if owners else ()):
+            for owner, name in owners[pdf_path]:
+                owner.add_document(name, prepare_sections(name, parsed))
+                loop.call_soon_threadsafe(job.emit, {"event": "indexed", "document": name})
+        return len(owners)
+
+    async def _run(self, job):
+        run = job.run
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        job.status = "running"
+        job.emit({"event": "started"})
+        try:
+            with tracing.span("service.job", collection=run.name, job=job.id):
+                # Jobs over one collection index it in turn; the second finds it up to date
+                async with self.collection_locks[str(run.pdf_dir.resolve())]:
+                    parsed = await loop.run_in_executor(None, self._index, job, loop)
+                job.timings["index"] = round(time.perf_counter() - started, 3)
+                job.timings["parsed_documents"] = parsed
+                job.output = await summarize_collection(run, self.client, job.top_k, llm_sections=job.llm_sections,
+                                                        on_event=job.emit, deadline=job.deadline)
+            job.timings["total"] = round(time.perf_counter() - started, 3)
+            job.status = "done"
+            self.completed += 1
+            log(f"[{run.name}] Job {job.id} done in {job.timings['total']:.2f}s ({parsed} PDF(s) parsed)")
+            job.emit({"event": "done", "output": job.output})
+        except Exception as e:
+            log(f"[{run.name}] Job {job.id} failed: {e!r}")
+            job.error = repr(e)
+            job.status = "failed"
+            job.emit({"event": "failed", "error": job.error})
+
+    def health(self) -> dict:
+        health = {"status": "ok", "backend": self.client.name, "model_calls": self.client.calls,
+                  "queued": self.queue.qsize(), "active": len(self.active), "completed": self.completed,
+                  "collections": len(self.stores)}
+        if getattr(self.client, "pool", None) is not None:
+            health["endpoints"] = self.client.pool.stats()
+        return health
+
+
+def create_app(service: AnalysisService) -> web.Application:
+    routes = web.RouteTableDef()
+
+    def get_job(request):
+        job = service.jobs.get(request.match_info["job_id"])
+        if job is None:
+            raise web.HTTPNotFound(text=json.dumps({"error": "unknown job"}), content_type="application/json")
+        return job
+
+    @routes.post("/jobs")
+    async def submit(request):
+        try:
+            body = await request.json()
+            if not isinstance(body, dict):
+                raise ValueError("the job must be a JSON object")
+            job, deduplicated = service.submit(
+                body, collection=body.get("collection"), pdf_dir=body.get("pdf_dir"),
+                top_k=int(body.get("top_k", RETRIEVAL_TOP_K)), llm_sections=int(body.get("llm_sections", LLM_SECTIONS)),
+                deadline=float(body.get("deadline", 0))
+            )
+        except (TypeError, ValueError) as e:
+            return web.json_response({"error": str(e)}, status=400)
+        return web.json_response({**job.describe(with_output=False), "deduplicated": deduplicated}, status=202)
+
+    @routes.get("/jobs/{job_id}")
+    async def status(request):
+        return web.json_response(get_job(request).describe())
+
+    @routes.get("/jobs/{job_id}/events")
+    async def events(request):
+        job = get_job(request)
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        async for event in job.events_from(int(request.query.get("from", "0"))):
+            await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    @routes.get("/jobs/{job_id}/result")
+    async def result(request):
+        job = get_job(request)
+        await job.wait()
+        if job.status == "failed":
+            return web.json_response({"error": job.error}, status=500)
+        return web.json_response(job.output)
+
+    @routes.get("/health")
+    async def health(request):
+        return web.json_response(service.health())
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.add_routes(routes)
+    return app
+
+
+async def serve(host=SERVICE_HOST, port=SERVICE_PORT, socket_path=SERVICE_SOCKET, **service_options):
+    async with AnalysisService(**service_options) as service:
+        runner = web.AppRunner(create_app(service))
+        await runner.setup()
+        if socket_path:
+            site = web.UnixSite(runner, socket_path)
+            where = socket_path
+        else:
+            site = web.TCPSite(runner, host, port)
+            where = f"http://{host}:{port}"
+        await site.start()
+        log(f"Listening on {where}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the analysis as a long-running HTTP service.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--socket", default=SERVICE_SOCKET, help="listen on this Unix socket instead")
+    parser.add_argument("--jobs", type=int, default=SERVICE_JOBS, help="jobs run concurrently")
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="extraction processes")
+    parser.add_argument("--max-in-flight", type=int, default=OLLAMA_MAX_IN_FLIGHT,
+                        help="concurrent model calls per Ollama endpoint, across all jobs")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.socket, workers=args.jobs, extract_workers=args.workers,
+                          max_in_flight=args.max_in_flight))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
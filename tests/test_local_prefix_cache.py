@@ -0,0 +1,75 @@
+"""The local backend's prefix KV cache must actually be used for batch prompts."""
+
+import re
+
+import pytest
+
+import llm_backend
+from ollama_integration import batch_prompt_prefix, build_batch_prompt
+
+PERSONA, JOB = "Travel Planner", "Plan a trip of 4 days for a group of 10 college friends."
+BATCH = [{"idx": 1, "heading": "Nice", "excerpt": "A city on the coast."},
+         {"idx": 2, "heading": "Cannes", "excerpt": "Known for its festival."}]
+
+
+def gemma_like_tokens(text):
+    """Like Gemma's tokenizer, a run of newlines is a single token."""
+    return re.findall(r"\n+|[^\S\n]+|\w+|[^\w\s]", text)
+
+
+def test_prefix_tokenizes_as_start_of_prompt():
+    prefix = batch_prompt_prefix(PERSONA, JOB)
+    prompt = build_batch_prompt("guide.pdf", BATCH, PERSONA, JOB)
+    assert prompt.startswith(prefix)
+    prefix_tokens = gemma_like_tokens(prefix)
+    assert gemma_like_tokens(prompt)[:len(prefix_tokens)] == prefix_tokens
+
+
+class FakeTokenizer:
+    pad_token_id = 0
+
+    def __init__(self, torch):
+        self.torch = torch
+        self.vocab = {}
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        return f"<start_of_turn>user\n{messages[0]['content']}<end_of_turn>\n<start_of_turn>model\n"
+
+    def __call__(self, text, return_tensors="pt", add_special_tokens=False, padding=False):
+        ids = [self.vocab.setdefault(t, len(self.vocab) + 1) for t in gemma_like_tokens(text)]
+        return {"input_ids": self.torch.tensor([ids])}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return '[{"idx": 1, "summary": "cached"}]'
+
+
+class FakeModel:
+    def __init__(self, torch):
+        self.torch = torch
+        self.generated_with_cache = []
+
+    def __call__(self, ids, use_cache=True):
+        return type("Output", (), {"past_key_values": ("kv", ids.shape[1])})()
+
+    def generate(self, input_ids, attention_mask=None, past_key_values=None, max_new_tokens=1, **_):
+        self.generated_with_cache.append(past_key_values)
+        return self.torch.cat([input_ids, self.torch.ones((1, 1), dtype=input_ids.dtype)], dim=1)
+
+
+def test_cached_prefix_path_is_taken(monkeypatch):
+    torch = pytest.importorskip("torch")
+    tokenizer, model = FakeTokenizer(torch), FakeModel(torch)
+    monkeypatch.setattr(llm_backend, "_load_local_model", lambda name, threads: (tokenizer, model))
+    backend = llm_backend.LocalModelBackend(use_cache=False)
+
+    def full_prefill(prompts, max_new_tokens):
+        raise AssertionError("fell back to a full prefill")
+
+    monkeypatch.setattr(backend, "_run", full_prefill)
+    prefix = batch_prompt_prefix(PERSONA, JOB)
+    for name in ("a.pdf", "b.pdf"):
+        prompt = build_batch_prompt(name, BATCH, PERSONA, JOB)
+        assert backend._run_prefixed(prompt, prefix, 8) == '[{"idx": 1, "summary": "cached"}]'
+    assert len(backend._prefix_caches) == 1
+    prefix_length = next(iter(backend._prefix_caches.values()))[0].shape[1]
+    assert model.generated_with_cache == [("kv", prefix_length)] * 2
@@ -0,0 +1,43 @@
+"""
+The heuristic heading classifier must keep producing the original outlines.
+
+data/baseline_outlines.json holds the outline JSON that the original extractor
+(before the columnar span table and the bookmark fast path) wrote for every
+bundled PDF. With OUTLINE_USE_TOC off, ParsedDocument and the streaming
+extract_outline_tree must both reproduce it exactly.
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+import process_pdfs
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = json.loads((Path(__file__).parent / "data" / "baseline_outlines.json").read_text(encoding="utf-8"))
+
+
+def pdf_path(key):
+    collection, name = key.split("/", 1)
+    return ROOT / collection / "PDFs" / name
+
+
+@pytest.fixture(autouse=True)
+def heuristics_only(monkeypatch):
+    monkeypatch.setattr(process_pdfs, "OUTLINE_USE_TOC", False)
+
+
+def as_written(tree):
+    """The outline JSON as write_outline_json stores it."""
+    return json.loads(json.dumps(process_pdfs.outline_json(tree), ensure_ascii=False))
+
+
+@pytest.mark.parametrize("key", sorted(BASELINE))
+def test_parsed_document_outline_matches_baseline(key):
+    assert as_written(process_pdfs.ParsedDocument(pdf_path(key)).outline_tree) == BASELINE[key]
+
+
+@pytest.mark.parametrize("key", sorted(BASELINE))
+def test_streamed_outline_matches_baseline(key):
+    assert as_written(process_pdfs.extract_outline_tree(pdf_path(key))) == BASELINE[key]
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Per-stage tracing and metrics.
+
+Stages are wrapped in spans:
+
+    with tracing.span("prompt.build", document=name, batch=key):
+        ...
+
+Attributes of enclosing spans (document, batch, ...) are inherited by nested
+spans, across awaits and asyncio tasks. Finished spans become Chrome trace
+events ("X" phase; open the file in chrome://tracing or ui.perfetto.dev) and
+feed per-stage latency histograms; incr() keeps plain counters.
+
+Tracing is off unless TRACE_PATH is set; span() then returns a shared no-op
+object, so instrumented code pays one global lookup per span. Worker processes
+hand their events back with drain()/merge(). TRACE_PROFILE=<file> additionally
+runs the pipeline under cProfile and dumps the stats there.
+
+Usage:
+    TRACE_PATH=trace.json python ollama_integration.py
+    python tracing.py trace.json        # print the metrics summary of a trace file
+"""
+
+import argparse
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+TRACE_PATH = os.environ.get("TRACE_PATH", "")
+TRACE_PROFILE = os.environ.get("TRACE_PROFILE", "")
+
+_enabled = bool(TRACE_PATH)
+_events = []
+_counters = {}
+_lock = threading.Lock()
+_attrs = contextvars.ContextVar("trace_attrs", default={})
+# Wall-clock offset so events from different processes share one time axis
+_epoch = time.time() - time.perf_counter()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "_token")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Attach attributes known only once the stage has run (sizes, counts)."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.attrs = {**_attrs.get(), **self.attrs}
+        self._token = _attrs.set(self.attrs)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        _attrs.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _add_event(self.name, self.start, end - self.start, self.attrs)
+        return False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(path=None):
+    """Turn tracing on at runtime (e.g. from a CLI flag); path replaces TRACE_PATH."""
+    global _enabled, TRACE_PATH
+    _enabled = True
+    if path:
+        TRACE_PATH = str(path)
+        # Let worker processes started from here on trace as well
+        os.environ["TRACE_PATH"] = TRACE_PATH
+
+
+def span(name, **attrs):
+    """Context manager timing one stage; a no-op when tracing is off."""
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, attrs)
+
+
+def record(name, seconds, **attrs):
+    """Record a stage measured elsewhere (e.g. time to first token) that ended just now."""
+    if _enabled:
+        _add_event(name, time.perf_counter() - seconds, seconds, {**_attrs.get(), **attrs})
+
+
+def incr(name, n=1):
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def _add_event(name, start, seconds, attrs):
+    event = {
+        "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+        "ts": round((_epoch + start) * 1e6), "dur": round(seconds * 1e6), "args": attrs,
+    }
+    with _lock:
+        _events.append(event)
+
+
+def drain():
+    """Events and counters recorded so far in this process, which are then forgotten."""
+    global _events, _counters
+    with _lock:
+        state = {"events": _events, "counters": _counters}
+        _events, _counters = [], {}
+    return state
+
+
+def merge(state):
+    """Add what drain() returned in another process."""
+    if not state:
+        return
+    with _lock:
+        _events.extend(state["events"])
+        for name, n in state["counters"].items():
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * q / 100)))]
+
+
+def metrics(events=None, counters=None):
+    """{"counters": {...}, "stages": {name: {count, total_ms, p50_ms, p95_ms, max_ms}}}."""
+    with _lock:
+        events = list(_events if events is None else events)
+        counters = dict(_counters if counters is None else counters)
+    durations = {}
+    for event in events:
+        durations.setdefault(event["name"], []).append(event["dur"] / 1000)
+    stages = {}
+    for name, values in sorted(durations.items()):
+        values.sort()
+        stages[name] = {
+            "count": len(values), "total_ms": round(sum(values), 1), "p50_ms": round(_percentile(values, 50), 2),
+            "p95_ms": round(_percentile(values, 95), 2), "max_ms": round(values[-1], 2),
+        }
+    return {"counters": counters, "stages": stages}
+
+
+def summary(summary_metrics=None) -> str:
+    summary_metrics = summary_metrics or metrics()
+    lines = [f"  {'stage':<22} {'count':>6} {'total ms':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}"]
+    for name, s in summary_metrics["stages"].items():
+        lines.append(f"  {name:<22} {s['count']:>6} {s['total_ms']:>10} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['max_ms']:>8}")
+    for name, n in sorted(summary_metrics["counters"].items()):
+        lines.append(f"  {name:<22} {n:>6}")
+    return "\n".join(lines)
+
+
+def write_trace(path=None):
+    """Write the trace events and the metrics summary as one JSON file; returns its path."""
+    path = path or TRACE_PATH
+    if not _enabled or not path:
+        return None
+    with _lock:
+        events = list(_events)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "metrics": metrics(events)}, f)
+    return path
+
+
+@contextlib.contextmanager
+def profiled(path=None):
+    """Run the block under cProfile and dump the stats to path (TRACE_PROFILE); no-op when unset."""
+    path = path or TRACE_PROFILE
+    if not path:
+        yield
+        return
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a trace file.")
+    parser.add_argument("trace")
+    args = parser.parse_args()
+    with open(args.trace, encoding="utf-8") as f:
+        trace = json.load(f)
+    print(summary(trace.get("metrics") or metrics(trace["traceEvents"], {})))
+
+
+if __name__ == "__main__":
+    main()